@@ -0,0 +1,269 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from dotenv import load_dotenv
+import httpx
+from supabase import create_client, Client
+from log_shipper import SupabaseLogHandler
+
+load_dotenv()
+
+# =============================================================================
+# Config
+# =============================================================================
+SUPABASE_URL = os.getenv("SUPABASE_URL", "")
+# O worker atualiza outbox/analise_fluxo fora do contexto de um usuário: prefira a service role
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "") or os.getenv("SUPABASE_ANON_KEY", "")
+# Fallback da integração 'api' quando external_api_url não está no Vault
+EXTERNAL_API_URL = os.getenv("EXTERNAL_API_URL", "")
+
+OUTBOX_TABLE = os.getenv("OUTBOX_TABLE", "analise_outbox")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "8"))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+# Retries rápidos dentro do mesmo ciclo (erros de rede/5xx) antes de devolver à fila
+OUTBOX_HTTP_RETRIES = int(os.getenv("OUTBOX_HTTP_RETRIES", "2"))
+OUTBOX_HTTP_TIMEOUT = float(os.getenv("OUTBOX_HTTP_TIMEOUT", "120"))
+
+# Resultado de cada chamada vai para a tabela logs, como faziam os triggers
+LOG_SHIP_ENABLED = os.getenv("LOG_SHIP_ENABLED", "true").lower() in ("1", "true", "yes")
+LOG_SHIP_TABLE = os.getenv("LOG_SHIP_TABLE", "logs")
+LOG_SHIP_FLUSH_SECONDS = float(os.getenv("LOG_SHIP_FLUSH_SECONDS", "2"))
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+    raise RuntimeError("Faltam SUPABASE_URL e/ou SUPABASE_SERVICE_ROLE_KEY (ou SUPABASE_ANON_KEY) no .env")
+
+supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+
+logger = logging.getLogger("honsha.analysis_worker")
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+log_handler: Optional[SupabaseLogHandler] = None
+if LOG_SHIP_ENABLED:
+    log_handler = SupabaseLogHandler(supabase, table=LOG_SHIP_TABLE, flush_interval=LOG_SHIP_FLUSH_SECONDS)
+    logger.addHandler(log_handler)
+
+
+class RetryableError(Exception):
+    """Falha temporária da API externa (rede, timeout, 429, 5xx)."""
+
+
+# =============================================================================
+# Fila (Supabase)
+# =============================================================================
+def claim_batch() -> list:
+    """
+    Reserva um lote da outbox (FOR UPDATE SKIP LOCKED + lease, ver migração).
+    Itens com lease vencido que já esgotaram OUTBOX_MAX_ATTEMPTS vão para 'erro' no claim.
+    """
+    resp = supabase.rpc("claim_analise_outbox", {
+        "batch_size": OUTBOX_BATCH_SIZE,
+        "lease_seconds": OUTBOX_LEASE_SECONDS,
+        "max_tentativas": OUTBOX_MAX_ATTEMPTS,
+    }).execute()
+    return getattr(resp, "data", None) or []
+
+def save_analysis(item: dict, api_response: dict) -> None:
+    """Grava a resposta na analise_fluxo reaproveitando a função SQL existente."""
+    supabase.rpc("process_api_response_to_analise_fluxo", {
+        "api_response": api_response,
+        "processo_id": item["processo_id"],
+        "transcricao_id": item["transcricao_id"],
+        "transcricao_tipo": item.get("tipo_transcricao"),
+    }).execute()
+
+def mark_done(outbox_ids: list) -> None:
+    """Fecha em lote (um único UPDATE) os itens concluídos."""
+    if not outbox_ids:
+        return
+    supabase.table(OUTBOX_TABLE).update({
+        "status": "concluido",
+        "bloqueado_ate": None,
+        "ultimo_erro": None,
+    }).in_("id", outbox_ids).execute()
+
+def mark_failed(item: dict, error: str) -> str:
+    """
+    Devolve o item à fila com backoff exponencial, ou marca erro ao esgotar as tentativas.
+    Retorna o novo status.
+    """
+    attempts = item.get("tentativas") or 1
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        update = {"status": "erro", "bloqueado_ate": None, "ultimo_erro": error[:2000]}
+    else:
+        delay = min(3600, 30 * (2 ** (attempts - 1)))
+        next_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+        update = {
+            "status": "pendente",
+            "bloqueado_ate": None,
+            "proxima_tentativa_em": next_at.isoformat(),
+            "ultimo_erro": error[:2000],
+        }
+    supabase.table(OUTBOX_TABLE).update(update).eq("id", item["outbox_id"]).execute()
+    return update["status"]
+
+
+# =============================================================================
+# API externa
+# =============================================================================
+def build_request_body(item: dict) -> dict:
+    """
+    Mesmo formato que o banco montava para a integração do item:
+      - webhook: envelope de send_transcricao_to_external_api ({headers, params, query, body})
+      - api / api_completa: corpo de send_transcricao_to_api
+    O timestamp é o do enfileiramento (momento em que o trigger disparou).
+    """
+    transcricao = {
+        "id": item["transcricao_id"],
+        "conteudo": item.get("conteudo") or "",
+        "tipo": item.get("tipo_transcricao"),
+    }
+    processo = {
+        "id": item["processo_id"],
+        "nome": item.get("processo_nome"),
+        "cliente": item.get("cliente_nome"),
+        "tipo_entrada": item.get("tipo_entrada"),
+    }
+    timestamp = item.get("enfileirado_em") or datetime.now(timezone.utc).isoformat()
+
+    if item.get("integracao") == "webhook":
+        return {
+            "headers": {
+                "content-type": "application/json",
+                "accept": "*/*",
+                "user-agent": "PostgreSQL Supabase Function",
+            },
+            "params": {},
+            "query": {},
+            "body": {"processo": processo, "timestamp": timestamp, "transcricao": transcricao},
+        }
+    return {"transcricao": transcricao, "processo": processo, "timestamp": timestamp}
+
+def target_url(item: dict) -> str:
+    """URL gravada no item (webhook) ou do Vault (resolvida no claim); EXTERNAL_API_URL como fallback."""
+    url = item.get("api_url") or ("" if item.get("integracao") == "webhook" else EXTERNAL_API_URL)
+    if not url:
+        raise RuntimeError("External API URL not configured. Vá em Settings → Vault e adicione external_api_url")
+    return url
+
+async def call_external_api(client: httpx.AsyncClient, item: dict) -> dict:
+    """POST na API externa com retries curtos para falhas temporárias."""
+    url = target_url(item)
+    body = build_request_body(item)
+    last_error = None
+    for attempt in range(OUTBOX_HTTP_RETRIES + 1):
+        try:
+            r = await client.post(url, json=body)
+            if r.status_code == 429 or r.status_code >= 500:
+                raise RetryableError(f"status {r.status_code}: {r.text[:500]}")
+            if r.status_code >= 400:
+                raise RuntimeError(f"External API request failed with status {r.status_code}: {r.text[:500]}")
+            try:
+                data = r.json()
+            except ValueError:
+                data = {"response": r.text}
+            # A função SQL espera um objeto JSON
+            return data if isinstance(data, dict) else {"response": data}
+        except (httpx.TransportError, RetryableError) as e:
+            last_error = e
+            if attempt < OUTBOX_HTTP_RETRIES:
+                await asyncio.sleep((2 ** attempt) + random.random())
+    raise RuntimeError(f"External API indisponível: {last_error}")
+
+
+# =============================================================================
+# Loop principal
+# =============================================================================
+async def process_item(client: httpx.AsyncClient, sem: asyncio.Semaphore, item: dict):
+    """Retorna o outbox_id em caso de sucesso ou None se falhou."""
+    async with sem:
+        extra = {
+            "outbox_id": item.get("outbox_id"),
+            "transcricao_id": item.get("transcricao_id"),
+            "processo_id": item.get("processo_id"),
+            "integracao": item.get("integracao"),
+            "tentativa": item.get("tentativas"),
+            "api_url": item.get("api_url") or EXTERNAL_API_URL,
+        }
+        started = time.perf_counter()
+        try:
+            api_response = await call_external_api(client, item)
+            # Só a integração completa gravava a resposta; nas demais a própria API grava
+            if item.get("integracao") == "api_completa":
+                await asyncio.to_thread(save_analysis, item, api_response)
+            logger.info("External API analysis completed successfully", extra={
+                **extra, "duracao_ms": round((time.perf_counter() - started) * 1000)})
+            return item["outbox_id"]
+        except Exception as e:
+            status = None
+            try:
+                status = await asyncio.to_thread(mark_failed, item, str(e))
+            finally:
+                logger.error(f"External API analysis failed: {e}", extra={
+                    **extra, "error": str(e), "novo_status": status,
+                    "duracao_ms": round((time.perf_counter() - started) * 1000)})
+            return None
+
+async def drain_once(client: httpx.AsyncClient, sem: asyncio.Semaphore) -> int:
+    """Processa um lote. Retorna quantos itens foram reservados."""
+    batch = await asyncio.to_thread(claim_batch)
+    if not batch:
+        return 0
+    results = await asyncio.gather(*(process_item(client, sem, item) for item in batch))
+    done = [r for r in results if r]
+    await asyncio.to_thread(mark_done, done)
+    print(f"[outbox] lote: {len(batch)} reservados, {len(done)} concluídos, {len(batch) - len(done)} com falha")
+    return len(batch)
+
+async def run_worker(stop: Optional[asyncio.Event] = None) -> None:
+    """
+    Drena a outbox continuamente. Lotes cheios são emendados sem espera;
+    quando a fila esvazia, dorme OUTBOX_POLL_SECONDS.
+    """
+    stop = stop or asyncio.Event()
+    sem = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+    limits = httpx.Limits(max_connections=OUTBOX_CONCURRENCY, max_keepalive_connections=OUTBOX_CONCURRENCY)
+    async with httpx.AsyncClient(timeout=OUTBOX_HTTP_TIMEOUT, limits=limits) as client:
+        while not stop.is_set():
+            try:
+                claimed = await drain_once(client, sem)
+            except Exception as e:
+                print(f"[outbox] erro ao drenar fila: {e}")
+                claimed = 0
+            if claimed < OUTBOX_BATCH_SIZE:
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=OUTBOX_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+
+def main():
+    once = "--once" in sys.argv[1:]
+    print(f"Worker da outbox iniciado (lote={OUTBOX_BATCH_SIZE}, concorrência={OUTBOX_CONCURRENCY})")
+
+    async def _run():
+        if once:
+            sem = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+            async with httpx.AsyncClient(timeout=OUTBOX_HTTP_TIMEOUT) as client:
+                await drain_once(client, sem)
+        else:
+            await run_worker()
+
+    if log_handler:
+        log_handler.start()
+    try:
+        asyncio.run(_run())
+    except KeyboardInterrupt:
+        print("Worker encerrado.")
+    finally:
+        if log_handler:
+            log_handler.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,16 @@
 import os
+import json
 import shutil
 import uuid
+import time
 import subprocess
 import mimetypes
+import logging
+import asyncio
 from pathlib import Path
 from typing import Optional
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import httpx
@@ -15,6 +19,15 @@ from pydub import AudioSegment
 import dropbox
 from supabase import create_client, Client
 from datetime import datetime
+from log_shipper import SupabaseLogHandler
+from streaming import iter_process_output, upload_chunks_to_dropbox
+from job_queue import JobQueue
+from reconcile import ReconciliationSweeper
+from preflight import PreflightError, CostModel, media_duration, run_preflight
+from transcripts import (
+    RenderedTranscript, TranscriptCache, make_etag, etag_matches,
+    negotiate_encoding, encode_payload, parse_range, MIN_COMPRESS_BYTES,
+)
 
 load_dotenv()
 
@@ -35,14 +48,79 @@ SUPABASE_TABLE = os.getenv("SUPABASE_TABLE", "transcricoes")
 # >>> NOVO: compressão por bitrate-alvo (kbps), sem teto fixo de MB
 TARGET_KBPS = int(os.getenv("TARGET_KBPS", "64"))
 
+# Fast path: se o áudio de entrada já está num codec aceito pelo Transkriptor e
+# com bitrate <= PASSTHROUGH_MAX_KBPS, não reencodamos (passthrough / stream copy)
+PASSTHROUGH_ENABLED = os.getenv("PASSTHROUGH_ENABLED", "true").lower() in ("1", "true", "yes")
+PASSTHROUGH_MAX_KBPS = int(os.getenv("PASSTHROUGH_MAX_KBPS", str(TARGET_KBPS)))
+PASSTHROUGH_CODECS = {
+    c.strip().lower()
+    for c in os.getenv("PASSTHROUGH_CODECS", "mp3,aac,opus").split(",")
+    if c.strip()
+}
+
 DEFAULT_LANGUAGE = os.getenv("DEFAULT_LANGUAGE", "pt-BR")
 DEFAULT_SERVICE = os.getenv("DEFAULT_SERVICE", "Standard")
 CALLBACK_URL = os.getenv("CALLBACK_URL", "")
 REFERENCE_PREFIX = os.getenv("REFERENCE_PREFIX", "dropbox")
 
+# Streaming: ffmpeg escreve em pipe e os blocos sobem para o Dropbox durante o encode
+# (latência ≈ max(encode, upload) em vez da soma; o MP3 final não toca o disco)
+STREAM_UPLOAD_ENABLED = os.getenv("STREAM_UPLOAD_ENABLED", "true").lower() in ("1", "true", "yes")
+STREAM_CHUNK_MB = int(os.getenv("STREAM_CHUNK_MB", "8"))
+STREAM_BUFFER_CHUNKS = int(os.getenv("STREAM_BUFFER_CHUNKS", "4"))
+
+# Logs estruturados → tabela logs do Supabase (em lote, fora do caminho da request)
+LOG_SHIP_ENABLED = os.getenv("LOG_SHIP_ENABLED", "true").lower() in ("1", "true", "yes")
+LOG_SHIP_LEVEL = os.getenv("LOG_SHIP_LEVEL", "INFO").upper()
+LOG_SHIP_TABLE = os.getenv("LOG_SHIP_TABLE", "logs")
+LOG_SHIP_CAPACITY = int(os.getenv("LOG_SHIP_CAPACITY", "5000"))
+LOG_SHIP_BATCH_SIZE = int(os.getenv("LOG_SHIP_BATCH_SIZE", "200"))
+LOG_SHIP_FLUSH_SECONDS = float(os.getenv("LOG_SHIP_FLUSH_SECONDS", "2"))
+LOG_SHIP_SAMPLE_RATE = float(os.getenv("LOG_SHIP_SAMPLE_RATE", "0.1"))
+
+# Reconciliação periódica de transcrições presas em "Em Andamento" (callback perdido)
+# Ative em um único nó (ou rode `python reconcile.py` à parte); as atualizações são idempotentes.
+RECONCILE_ENABLED = os.getenv("RECONCILE_ENABLED", "false").lower() in ("1", "true", "yes")
+RECONCILE_INTERVAL_SECONDS = float(os.getenv("RECONCILE_INTERVAL_SECONDS", "600"))
+RECONCILE_STALE_MINUTES = int(os.getenv("RECONCILE_STALE_MINUTES", "30"))
+RECONCILE_GIVE_UP_HOURS = int(os.getenv("RECONCILE_GIVE_UP_HOURS", "48"))
+RECONCILE_PAGE_SIZE = int(os.getenv("RECONCILE_PAGE_SIZE", "200"))
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "8"))
+TRANSKRIPTOR_STATUS_URL = os.getenv("TRANSKRIPTOR_STATUS_URL", "https://api.tor.app/developer/files/{order_id}/content")
+
+# Leitura de transcrições longas (paginação por segmento + LRU em memória)
+TRANSCRIPT_SEGMENT_CHARS = int(os.getenv("TRANSCRIPT_SEGMENT_CHARS", "4000"))
+TRANSCRIPT_PAGE_SEGMENTS = int(os.getenv("TRANSCRIPT_PAGE_SEGMENTS", "20"))
+TRANSCRIPT_CACHE_ENTRIES = int(os.getenv("TRANSCRIPT_CACHE_ENTRIES", "64"))
+TRANSCRIPT_CACHE_MB = int(os.getenv("TRANSCRIPT_CACHE_MB", "64"))
+
+# Pre-flight: ffprobe + decodificação de poucos segundos antes dos estágios pesados
+PREFLIGHT_ENABLED = os.getenv("PREFLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+PREFLIGHT_SAMPLE_SECONDS = float(os.getenv("PREFLIGHT_SAMPLE_SECONDS", "4"))
+PREFLIGHT_WINDOWS = int(os.getenv("PREFLIGHT_WINDOWS", "3"))
+# Janelas extras para confirmar silêncio antes de rejeitar (só decodificadas se a amostra vier muda)
+PREFLIGHT_SILENCE_WINDOWS = int(os.getenv("PREFLIGHT_SILENCE_WINDOWS", "12"))
+PREFLIGHT_SILENCE_DBFS = float(os.getenv("PREFLIGHT_SILENCE_DBFS", "-55"))
+PREFLIGHT_MIN_ACTIVE_RATIO = float(os.getenv("PREFLIGHT_MIN_ACTIVE_RATIO", "0.02"))
+PREFLIGHT_CLIP_RATIO = float(os.getenv("PREFLIGHT_CLIP_RATIO", "0.01"))
+PREFLIGHT_MAX_DURATION_MIN = float(os.getenv("PREFLIGHT_MAX_DURATION_MIN", "0"))  # 0 = sem limite
+# Segundos de Transkriptor por segundo de áudio (para o ETA)
+TRANSKRIPTOR_RTF = float(os.getenv("TRANSKRIPTOR_RTF", "0.5"))
+# Observações de preparo (transcricoes.tempo_preparo_segundos) usadas no ETA e a cada quanto relê-las
+COST_MODEL_SAMPLES = int(os.getenv("COST_MODEL_SAMPLES", "200"))
+COST_MODEL_REFRESH_SECONDS = float(os.getenv("COST_MODEL_REFRESH_SECONDS", "300"))
+
 WORK_DIR = Path(os.getenv("WORK_DIR", "./tmp")).resolve()
 WORK_DIR.mkdir(parents=True, exist_ok=True)
 
+# Modo fila: a API só recebe o upload e enfileira; workers (job_worker.py) fazem o resto.
+# JOB_STAGING_DIR precisa ser um volume compartilhado entre API e workers.
+JOB_QUEUE_ENABLED = os.getenv("JOB_QUEUE_ENABLED", "false").lower() in ("1", "true", "yes")
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+JOB_STAGING_DIR = Path(os.getenv("JOB_STAGING_DIR", str(WORK_DIR))).resolve()
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
 # Checagens básicas
 if not DROPBOX_REFRESH_TOKEN or not DROPBOX_APP_KEY or not DROPBOX_APP_SECRET:
     raise RuntimeError("Faltam DROPBOX_REFRESH_TOKEN, DROPBOX_APP_KEY ou DROPBOX_APP_SECRET no .env")
@@ -50,6 +128,8 @@ if not TRANSKRIPTOR_API_KEY:
     raise RuntimeError("Falta TRANSKRIPTOR_API_KEY no .env")
 if not SUPABASE_URL or not SUPABASE_ANON_KEY:
     raise RuntimeError("Faltam SUPABASE_URL e/ou SUPABASE_ANON_KEY no .env")
+if JOB_QUEUE_ENABLED and not DATABASE_URL:
+    raise RuntimeError("JOB_QUEUE_ENABLED=true requer DATABASE_URL no .env")
 
 # Função para renovar token Dropbox
 def refresh_dropbox_token():
@@ -95,6 +175,64 @@ try:
 except Exception as e:
     raise RuntimeError(f"Erro criando cliente Supabase: {e}")
 
+# Fila de jobs (Postgres direto)
+job_queue: Optional[JobQueue] = None
+if JOB_QUEUE_ENABLED:
+    JOB_STAGING_DIR.mkdir(parents=True, exist_ok=True)
+    job_queue = JobQueue(DATABASE_URL)
+
+# Sweeper de reconciliação com o Transkriptor
+reconciler = ReconciliationSweeper(
+    supabase,
+    api_key=TRANSKRIPTOR_API_KEY,
+    status_url=TRANSKRIPTOR_STATUS_URL,
+    stale_minutes=RECONCILE_STALE_MINUTES,
+    give_up_hours=RECONCILE_GIVE_UP_HOURS,
+    page_size=RECONCILE_PAGE_SIZE,
+    concurrency=RECONCILE_CONCURRENCY,
+)
+reconcile_stop = asyncio.Event()
+reconcile_task: Optional[asyncio.Task] = None
+
+def load_cost_observations() -> list:
+    """Tempos de preparo mais recentes gravados por qualquer nó (API ou worker)."""
+    if not supabase:
+        return []
+    resp = (supabase.table(SUPABASE_TABLE)
+            .select("audio_pipeline, duracao_audio_segundos, tempo_preparo_segundos")
+            .not_.is_("tempo_preparo_segundos", "null")
+            .order("created_at", desc=True)
+            .limit(COST_MODEL_SAMPLES)
+            .execute())
+    return [{
+        "pipeline": row.get("audio_pipeline"),
+        "duration_s": row.get("duracao_audio_segundos"),
+        "elapsed_s": row.get("tempo_preparo_segundos"),
+    } for row in getattr(resp, "data", None) or []]
+
+# Previsão de custo/ETA dos uploads (fatores compartilhados entre nós via transcricoes)
+cost_model = CostModel(
+    transkriptor_rtf=TRANSKRIPTOR_RTF,
+    loader=load_cost_observations,
+    refresh_seconds=COST_MODEL_REFRESH_SECONDS,
+)
+
+# Logger do backend: registros vão para a tabela logs via SupabaseLogHandler
+logger = logging.getLogger("honsha.backend")
+logger.setLevel(logging.DEBUG)
+log_handler: Optional[SupabaseLogHandler] = None
+if LOG_SHIP_ENABLED:
+    log_handler = SupabaseLogHandler(
+        supabase,
+        table=LOG_SHIP_TABLE,
+        capacity=LOG_SHIP_CAPACITY,
+        batch_size=LOG_SHIP_BATCH_SIZE,
+        flush_interval=LOG_SHIP_FLUSH_SECONDS,
+        sample_rate=LOG_SHIP_SAMPLE_RATE,
+        level=getattr(logging, LOG_SHIP_LEVEL, logging.INFO),
+    )
+    logger.addHandler(log_handler)
+
 # =============================================================================
 # App
 # =============================================================================
@@ -107,6 +245,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def start_log_shipper():
+    if log_handler:
+        log_handler.start()
+
+@app.on_event("shutdown")
+def stop_log_shipper():
+    if log_handler:
+        log_handler.close()
+
+@app.on_event("startup")
+async def start_reconciler():
+    global reconcile_task
+    if RECONCILE_ENABLED:
+        # Referência guardada: o loop só mantém referência fraca às tasks
+        reconcile_task = asyncio.create_task(reconciler.run_forever(RECONCILE_INTERVAL_SECONDS, reconcile_stop))
+
+@app.on_event("shutdown")
+async def stop_reconciler():
+    reconcile_stop.set()
+    if reconcile_task is None:
+        return
+    # Deixa a varredura em andamento terminar; se demorar, cancela
+    try:
+        await asyncio.wait_for(reconcile_task, timeout=10)
+    except asyncio.TimeoutError:
+        pass
+    except Exception as e:
+        print(f"[reconcile] erro ao encerrar: {e}")
+
 # =============================================================================
 # Utilitários
 # =============================================================================
@@ -117,10 +285,13 @@ def is_audio_mimetype(mtype: str) -> bool:
     return mtype.startswith("audio/")
 
 def ensure_ffmpeg() -> None:
-    try:
-        subprocess.run(["ffmpeg", "-version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-    except Exception:
-        raise HTTPException(status_code=500, detail="ffmpeg não encontrado no sistema. Instale o ffmpeg.")
+    # ffprobe vem no mesmo pacote, mas pode faltar em builds mínimos; sem ele o
+    # pre-flight rejeitaria todo upload como "arquivo corrompido"
+    for tool in ("ffmpeg", "ffprobe"):
+        try:
+            subprocess.run([tool, "-version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        except Exception:
+            raise HTTPException(status_code=500, detail=f"{tool} não encontrado no sistema. Instale o ffmpeg.")
 
 def run_ffmpeg_extract_audio(input_path: Path, output_mp3: Path, bitrate_kbps: int) -> None:
     """
@@ -137,6 +308,139 @@ def run_ffmpeg_extract_audio(input_path: Path, output_mp3: Path, bitrate_kbps: i
     ]
     subprocess.run(cmd, check=True)
 
+# Codec de áudio → (extensão do container de saída, args de formato do ffmpeg)
+AUDIO_COPY_CONTAINERS = {
+    "mp3": (".mp3", ["-f", "mp3"]),
+    "aac": (".m4a", ["-f", "ipod", "-movflags", "+faststart"]),
+    "opus": (".ogg", ["-f", "ogg"]),
+}
+
+# Containers que, contendo só áudio no codec certo, podem subir sem tocar no arquivo
+AUDIO_PASSTHROUGH_FORMATS = {
+    "mp3": {"mp3"},
+    "aac": {"mov", "mp4", "m4a", "3gp", "3g2", "mj2"},
+    "opus": {"ogg"},
+}
+
+def run_ffprobe(input_path: Path) -> dict:
+    """
+    Lê metadados do container/streams via ffprobe.
+    CalledProcessError = o ffprobe não reconheceu o arquivo; TimeoutExpired/OSError/
+    ValueError = falha da ferramenta, não do arquivo.
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-print_format", "json",
+        "-show_format", "-show_streams",
+        str(input_path)
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, timeout=30)
+    return json.loads(result.stdout or b"{}")
+
+def probe_media(input_path: Path) -> Optional[dict]:
+    """ffprobe tolerante: None em qualquer falha (o fluxo cai no reencode tradicional)."""
+    try:
+        return run_ffprobe(input_path)
+    except Exception:
+        return None
+
+def estimate_audio_kbps(input_path: Path, stream: dict, seconds: int = 60) -> Optional[float]:
+    """
+    Estima o bitrate de um stream de áudio somando o tamanho dos pacotes do
+    primeiro minuto (para MKV/WebM, que não trazem bit_rate por stream).
+    """
+    # mkvmerge costuma gravar o bitrate nas tags do stream (BPS / BPS-eng)
+    tags = stream.get("tags") or {}
+    for key in ("BPS", "BPS-eng"):
+        try:
+            return int(tags[key]) / 1000
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", str(stream.get("index", "a:0")),
+        "-read_intervals", f"%+{seconds}",
+        "-show_entries", "packet=size,pts_time,duration_time",
+        "-print_format", "json",
+        str(input_path)
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, timeout=30)
+        packets = json.loads(result.stdout or b"{}").get("packets") or []
+        total_bytes = sum(int(p["size"]) for p in packets)
+        start = float(packets[0]["pts_time"])
+        end = float(packets[-1]["pts_time"]) + float(packets[-1].get("duration_time") or 0)
+    except Exception:
+        return None
+    if end <= start:
+        return None
+    return total_bytes * 8 / (end - start) / 1000
+
+def plan_audio_pipeline(probe: Optional[dict], input_path: Optional[Path] = None) -> dict:
+    """
+    Decide o caminho de processamento a partir do ffprobe:
+      - "passthrough": o arquivo já é só áudio aceitável → sobe como está
+      - "remux":       o áudio é aceitável mas está junto de vídeo/outros streams → stream copy
+      - "transcode":   qualquer outro caso → reencode para MP3 em TARGET_KBPS
+    """
+    plan = {"pipeline": "transcode", "ext": ".mp3", "codec": None, "bitrate_kbps": None}
+    if not PASSTHROUGH_ENABLED or not probe:
+        return plan
+
+    streams = probe.get("streams") or []
+    audio_streams = [s for s in streams if s.get("codec_type") == "audio"]
+    if len(audio_streams) != 1:
+        return plan
+
+    audio = audio_streams[0]
+    codec = (audio.get("codec_name") or "").lower()
+    plan["codec"] = codec
+    if codec not in PASSTHROUGH_CODECS or codec not in AUDIO_COPY_CONTAINERS:
+        return plan
+
+    # Bitrate do stream; se ausente (ex.: opus em ogg), o do container só vale quando
+    # o áudio é o único stream. Em vídeo (MKV/WebM) o total inclui a trilha de vídeo,
+    # então estima pelos pacotes do áudio; sem estimativa, cai no transcode.
+    fmt = probe.get("format") or {}
+    other_streams = [s for s in streams if s is not audio]
+    raw_bitrate = audio.get("bit_rate") or (fmt.get("bit_rate") if not other_streams else None)
+    try:
+        bitrate_kbps = int(raw_bitrate) / 1000
+    except (TypeError, ValueError):
+        bitrate_kbps = estimate_audio_kbps(input_path, audio) if input_path else None
+        if bitrate_kbps is None:
+            return plan
+    plan["bitrate_kbps"] = round(bitrate_kbps)
+    if bitrate_kbps > PASSTHROUGH_MAX_KBPS:
+        return plan
+
+    plan["ext"] = AUDIO_COPY_CONTAINERS[codec][0]
+    # Capas (attached_pic) contam como vídeo para o ffprobe, mas não impedem o remux
+    format_names = set((fmt.get("format_name") or "").split(","))
+    if not other_streams and format_names & AUDIO_PASSTHROUGH_FORMATS[codec]:
+        plan["pipeline"] = "passthrough"
+    else:
+        plan["pipeline"] = "remux"
+    return plan
+
+def remux_audio_stream(input_path: Path, output_path: Path, codec: str) -> None:
+    """
+    Separa o stream de áudio sem reencodar (stream copy). Leva segundos mesmo
+    para gravações longas, pois só reescreve o container.
+    """
+    _, format_args = AUDIO_COPY_CONTAINERS[codec]
+    cmd = [
+        "ffmpeg", "-y",
+        "-i", str(input_path),
+        "-map", "0:a:0",
+        "-vn", "-sn", "-dn",
+        "-c:a", "copy",
+        *format_args,
+        str(output_path)
+    ]
+    subprocess.run(cmd, check=True)
+
 def transcode_audio_to_mp3(input_path: Path, output_mp3: Path, bitrate_kbps: int) -> None:
     """
     Converte qualquer áudio para MP3 no bitrate-alvo.
@@ -145,37 +449,74 @@ def transcode_audio_to_mp3(input_path: Path, output_mp3: Path, bitrate_kbps: int
     audio = AudioSegment.from_file(input_path)
     audio.export(output_mp3, format="mp3", bitrate=f"{bitrate_kbps}k")
 
-def upload_to_dropbox(local_path: Path, dropbox_dest_path: str) -> str:
+def dropbox_call(method: str, *args, **kwargs):
     """
-    Sobe arquivo e cria/obtém link compartilhável.
-    Retorna URL público (ex.: ...?dl=0).
-    Inclui renovação automática do token se necessário.
+    Executa um método do cliente Dropbox; se o token expirou, renova e tenta de novo.
     """
     global dbx
-    
-    def _try_upload():
-        with local_path.open("rb") as f:
-            dbx.files_upload(f.read(), dropbox_dest_path, mode=dropbox.files.WriteMode("overwrite"))
-
-        try:
-            link = dbx.sharing_create_shared_link_with_settings(dropbox_dest_path)
-            return link.url
-        except dropbox.exceptions.ApiError:
-            res = dbx.sharing_list_shared_links(path=dropbox_dest_path, direct_only=True)
-            if res.links:
-                return res.links[0].url
-            else:
-                raise
-    
     try:
-        return _try_upload()
+        return getattr(dbx, method)(*args, **kwargs)
     except dropbox.exceptions.AuthError:
         # Token expirado, renova e tenta novamente
         print("Token Dropbox expirado durante upload, renovando...")
         new_token = refresh_dropbox_token()
         dbx = dropbox.Dropbox(new_token)
-        print("Token renovado, tentando upload novamente...")
-        return _try_upload()
+        print("Token renovado, tentando novamente...")
+        return getattr(dbx, method)(*args, **kwargs)
+
+def get_dropbox_shared_link(dropbox_dest_path: str) -> str:
+    """Cria (ou obtém, se já existir) o link compartilhável do arquivo."""
+    try:
+        link = dropbox_call("sharing_create_shared_link_with_settings", dropbox_dest_path)
+        return link.url
+    except dropbox.exceptions.ApiError:
+        res = dropbox_call("sharing_list_shared_links", path=dropbox_dest_path, direct_only=True)
+        if res.links:
+            return res.links[0].url
+        else:
+            raise
+
+def safe_dropbox_name(filename: Optional[str]) -> str:
+    """Nome limpo e estável (sem extensão) para o arquivo na raiz do Dropbox."""
+    safe_name = Path(filename or "audio.mp3").stem
+    return "".join(c for c in safe_name if c.isalnum() or c in ("-", "_")).strip() or "audio"
+
+def upload_to_dropbox(local_path: Path, dropbox_dest_path: str) -> str:
+    """
+    Sobe arquivo e cria/obtém link compartilhável.
+    Retorna URL público (ex.: ...?dl=0).
+    Inclui renovação automática do token se necessário.
+    """
+    with local_path.open("rb") as f:
+        dropbox_call("files_upload", f.read(), dropbox_dest_path, mode=dropbox.files.WriteMode("overwrite"))
+    return get_dropbox_shared_link(dropbox_dest_path)
+
+def ffmpeg_mp3_pipe_cmd(input_path: Path, bitrate_kbps: int) -> list:
+    """Mesmo encode de run_ffmpeg_extract_audio, mas com saída MP3 no stdout."""
+    return [
+        "ffmpeg", "-y",
+        "-nostdin", "-loglevel", "error",
+        "-i", str(input_path),
+        "-vn",
+        "-ar", "44100",
+        "-ac", "2",
+        "-b:a", f"{bitrate_kbps}k",
+        "-f", "mp3",
+        "pipe:1"
+    ]
+
+def stream_transcode_to_dropbox(input_path: Path, dropbox_dest_path: str, bitrate_kbps: int) -> str:
+    """
+    Reencoda para MP3 e sobe para o Dropbox ao mesmo tempo (upload session),
+    sem gravar o MP3 em disco. Retorna o link compartilhável.
+    """
+    chunks = iter_process_output(
+        ffmpeg_mp3_pipe_cmd(input_path, bitrate_kbps),
+        chunk_size=STREAM_CHUNK_MB * 1024 * 1024,
+        max_buffered_chunks=STREAM_BUFFER_CHUNKS,
+    )
+    upload_chunks_to_dropbox(dropbox_call, chunks, dropbox_dest_path)
+    return get_dropbox_shared_link(dropbox_dest_path)
 
 async def send_to_transkriptor(file_url: str, language: str, service: str, callback_url: str, reference: str) -> str:
     headers = {
@@ -202,7 +543,9 @@ async def send_to_transkriptor(file_url: str, language: str, service: str, callb
 
 def supabase_insert(processo_id: str, filename: str, order_id: str = "", status: str = "processando", 
                    conteudo: str = "", dropbox_url: str = "", dropbox_filename: str = "", 
-                   tipo_transcricao: str = "") -> dict:
+                   tipo_transcricao: str = "", audio_pipeline: str = "",
+                   duracao_audio: Optional[float] = None, previsao_conclusao: str = "",
+                   tempo_preparo: Optional[float] = None) -> dict:
     """Insere registro na tabela transcricoes com a nova estrutura"""
     if not supabase:
         raise HTTPException(status_code=500, detail="Cliente Supabase não inicializado.")
@@ -221,10 +564,110 @@ def supabase_insert(processo_id: str, filename: str, order_id: str = "", status:
     # Adiciona tipo_transcricao se fornecido
     if tipo_transcricao:
         insert_data["tipo_transcricao"] = tipo_transcricao
+
+    # Registra qual caminho de áudio foi usado (passthrough / remux / transcode)
+    if audio_pipeline:
+        insert_data["audio_pipeline"] = audio_pipeline
+
+    # Duração e ETA calculados no pre-flight
+    if duracao_audio:
+        insert_data["duracao_audio_segundos"] = duracao_audio
+    if previsao_conclusao:
+        insert_data["previsao_conclusao"] = previsao_conclusao
+    # Observação do CostModel: pipeline de áudio até o link público no Dropbox
+    if tempo_preparo is not None:
+        insert_data["tempo_preparo_segundos"] = round(tempo_preparo, 2)
     
     resp = supabase.table(SUPABASE_TABLE).insert(insert_data).execute()
     return resp.data[0] if getattr(resp, "data", None) else {}
 
+def estimate_queue_wait() -> dict:
+    """Espera prevista na fila de jobs (0 se a consulta falhar: o ETA só fica otimista)."""
+    try:
+        return job_queue.estimate_wait()
+    except Exception as e:
+        logger.warning(f"Falha ao estimar espera na fila: {e}")
+        return {"total_s": 0.0, "estagios": {}}
+
+def preflight_check(input_path: Path) -> tuple:
+    """
+    Roda o ffprobe uma vez e o pre-flight (preflight.py) sobre o resultado.
+    Retorna (probe, relatório); arquivo ruim vira HTTP 422 antes de qualquer estágio pesado.
+    Falha das ferramentas (timeout, erro do ffprobe/ffmpeg) não rejeita o upload:
+    o pre-flight é pulado com um aviso e, sem probe, o pipeline cai no transcode.
+    """
+    if not PREFLIGHT_ENABLED:
+        return probe_media(input_path), {"duration_s": None, "warnings": []}
+    try:
+        probe = run_ffprobe(input_path)
+    except subprocess.CalledProcessError:
+        # O ffprobe rodou e não reconheceu o arquivo: run_preflight rejeita
+        probe = None
+    except Exception as e:
+        logger.warning(f"ffprobe falhou no pre-flight; seguindo com transcode: {e}",
+                       extra={"input_path": str(input_path)})
+        return None, {"duration_s": None,
+                      "warnings": ["Pre-flight indisponível (falha do ffprobe); arquivo será reencodado."]}
+    try:
+        report = run_preflight(
+            input_path, probe,
+            sample_seconds=PREFLIGHT_SAMPLE_SECONDS,
+            windows=PREFLIGHT_WINDOWS,
+            silence_windows=PREFLIGHT_SILENCE_WINDOWS,
+            silence_dbfs=PREFLIGHT_SILENCE_DBFS,
+            min_active_ratio=PREFLIGHT_MIN_ACTIVE_RATIO,
+            clip_ratio_warn=PREFLIGHT_CLIP_RATIO,
+            max_duration_s=PREFLIGHT_MAX_DURATION_MIN * 60 or None,
+        )
+    except PreflightError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except (subprocess.TimeoutExpired, OSError) as e:
+        # Decodificação da amostra travou (máquina sobrecarregada) ou ffmpeg indisponível:
+        # segue com o que o ffprobe já informou
+        logger.warning(f"Amostragem do pre-flight falhou; seguindo sem ela: {e}",
+                       extra={"input_path": str(input_path)})
+        return probe, {"duration_s": media_duration(probe), "warnings": [
+            "Pre-flight incompleto (amostragem do áudio excedeu o tempo limite)."]}
+    return probe, report
+
+transcript_cache = TranscriptCache(
+    max_entries=TRANSCRIPT_CACHE_ENTRIES,
+    max_bytes=TRANSCRIPT_CACHE_MB * 1024 * 1024,
+)
+
+def load_transcript(transcricao_id: str, if_none_match: Optional[str] = None,
+                    page: Optional[tuple] = None) -> tuple:
+    """
+    Busca só id/updated_at para montar o ETag; o conteúdo (que pode ter MBs)
+    só é lido do Supabase quando não está na LRU.
+    page=(cursor, limit) monta o ETag da página em vez do ETag do texto completo.
+    Retorna (etag da resposta, RenderedTranscript), ou (etag, None) quando o
+    If-None-Match já bate (304 sem ler o conteúdo, mesmo com a LRU fria).
+    """
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Cliente Supabase não inicializado.")
+
+    resp = supabase.table(SUPABASE_TABLE).select("id, updated_at").eq("id", transcricao_id).limit(1).execute()
+    rows = getattr(resp, "data", None) or []
+    if not rows:
+        raise HTTPException(status_code=404, detail="Transcrição não encontrada.")
+    etag = make_etag(transcricao_id, rows[0].get("updated_at") or "")
+    response_etag = make_etag(transcricao_id, etag, *page) if page else etag
+    if etag_matches(if_none_match, response_etag):
+        return response_etag, None
+
+    cached = transcript_cache.get(transcricao_id, etag)
+    if cached:
+        return response_etag, cached
+
+    resp = supabase.table(SUPABASE_TABLE).select("conteudo").eq("id", transcricao_id).limit(1).execute()
+    rows = getattr(resp, "data", None) or []
+    if not rows:
+        raise HTTPException(status_code=404, detail="Transcrição não encontrada.")
+    rendered = RenderedTranscript(transcricao_id, etag, rows[0].get("conteudo") or "", TRANSCRIPT_SEGMENT_CHARS)
+    transcript_cache.put(rendered)
+    return response_etag, rendered
+
 # =============================================================================
 # Endpoint principal
 # =============================================================================
@@ -238,44 +681,97 @@ async def upload(processo_id: str,
     """
     Fluxo:
       - recebe upload
-      - vídeo → extrai MP3 já no bitrate-alvo (TARGET_KBPS)
-      - áudio → converte/reencoda para MP3 (TARGET_KBPS)
+      - pre-flight: rejeita (422) arquivo que o ffmpeg não decodifica, sem áudio ou mudo e
+        calcula duração + previsão de conclusão (ETA)
+      - ffprobe decide o caminho (pipeline):
+          passthrough → áudio já aceitável (codec/bitrate), sobe como está
+          remux       → áudio aceitável dentro de vídeo, stream copy sem reencode
+          transcode   → vídeo/áudio fora do padrão, reencoda para MP3 (TARGET_KBPS);
+                        com STREAM_UPLOAD_ENABLED o MP3 sobe durante o encode
       - sobe no Dropbox (raiz) e cria link público
       - envia URL ao Transkriptor
       - grava registro no Supabase (status Em Andamento; transcription vazia)
+    Com JOB_QUEUE_ENABLED, só salva o arquivo no JOB_STAGING_DIR, enfileira um job
+    'transcode' e responde 202; o andamento fica em GET /jobs/{job_id}.
     """
     language = language or DEFAULT_LANGUAGE
     service = service or DEFAULT_SERVICE
     ref = reference or f"{REFERENCE_PREFIX}-{uuid.uuid4().hex[:8]}"
 
-    # Salvar upload original
+    # Salvar upload original (no modo fila, direto no volume compartilhado)
     suffix = Path(file.filename or f"upload-{uuid.uuid4().hex}").suffix or ""
-    orig_path = WORK_DIR / f"orig-{uuid.uuid4().hex}{suffix}"
+    orig_path = (JOB_STAGING_DIR if job_queue else WORK_DIR) / f"orig-{uuid.uuid4().hex}{suffix}"
     with orig_path.open("wb") as out:
         shutil.copyfileobj(file.file, out)
 
     # Detectar mimetype (fallback por extensão)
     mtype = file.content_type or mimetypes.guess_type(str(orig_path))[0] or ""
 
-    # Arquivo MP3 final (sempre reencodado para reduzir bastante o tamanho)
-    mp3_final = WORK_DIR / f"final-{uuid.uuid4().hex}.mp3"
+    # Arquivo de áudio final (o nome/extensão depende do pipeline escolhido)
+    audio_final = WORK_DIR / f"final-{uuid.uuid4().hex}.mp3"
 
     try:
-        if is_video_mimetype(mtype):
-            ensure_ffmpeg()
-            run_ffmpeg_extract_audio(orig_path, mp3_final, TARGET_KBPS)
-        elif is_audio_mimetype(mtype):
-            # Se já é mp3, ainda assim reencodamos para TARGET_KBPS para redução agressiva.
-            transcode_audio_to_mp3(orig_path, mp3_final, TARGET_KBPS)
-        else:
+        if not (is_video_mimetype(mtype) or is_audio_mimetype(mtype)):
             raise HTTPException(status_code=400, detail=f"Tipo de arquivo não suportado: {mtype or 'desconhecido'}")
 
-        # Sobe no Dropbox (na raiz). Nome limpo e estável:
-        safe_name = Path(file.filename or "audio.mp3").stem
-        safe_name = "".join(c for c in safe_name if c.isalnum() or c in ("-", "_")).strip() or "audio"
-        dropbox_dest = f"/{safe_name}.mp3"
+        ensure_ffmpeg()
+        probe, report = preflight_check(orig_path)
+        plan = plan_audio_pipeline(probe, orig_path)
+        pipeline = plan["pipeline"]
+        duration_s = report["duration_s"]
+        queue_wait = estimate_queue_wait() if job_queue else {"total_s": 0.0}
+        prediction = cost_model.predict(pipeline, duration_s, queue_wait_s=queue_wait["total_s"])
+        preflight = {**report, "prediction": prediction}
+
+        if job_queue:
+            job_id = job_queue.enqueue("transcode", {
+                "input_path": str(orig_path),
+                "filename": file.filename or "",
+                "mtype": mtype,
+                "processo_id": processo_id,
+                "language": language,
+                "service": service,
+                "reference": ref,
+                "tipo_transcricao": tipo_transcricao or "",
+                "duration_s": duration_s,
+                "eta": prediction["eta"],
+            }, processo_id=processo_id, max_tentativas=JOB_MAX_ATTEMPTS)
+            # O arquivo agora pertence ao worker
+            orig_path = None
+            logger.info("Upload enfileirado", extra={"processo_id": processo_id, "job_id": job_id,
+                                                     "duration_s": duration_s, "eta": prediction["eta"]})
+            return JSONResponse({
+                "message": "Arquivo recebido e enfileirado para processamento.",
+                "job_id": job_id,
+                "status_url": f"/jobs/{job_id}",
+                "preflight": preflight,
+            }, status_code=202)
+
+        # Tempo de preparo (mesma medida do job_worker): do início do pipeline ao link público
+        stage_started = time.perf_counter()
 
-        public_url = upload_to_dropbox(mp3_final, dropbox_dest)
+        # Sobe no Dropbox (na raiz). Nome limpo e estável:
+        safe_name = safe_dropbox_name(file.filename)
+        dropbox_filename = f"{safe_name}{plan['ext']}"
+        dropbox_dest = f"/{dropbox_filename}"
+
+        if pipeline == "passthrough":
+            # Já está no formato certo: sobe o próprio arquivo original
+            public_url = upload_to_dropbox(orig_path, dropbox_dest)
+        elif pipeline == "remux":
+            audio_final = audio_final.with_suffix(plan["ext"])
+            remux_audio_stream(orig_path, audio_final, plan["codec"])
+            public_url = upload_to_dropbox(audio_final, dropbox_dest)
+        elif STREAM_UPLOAD_ENABLED:
+            # Encode e upload em paralelo; o MP3 final não é gravado em disco
+            public_url = stream_transcode_to_dropbox(orig_path, dropbox_dest, TARGET_KBPS)
+        else:
+            if is_video_mimetype(mtype):
+                run_ffmpeg_extract_audio(orig_path, audio_final, TARGET_KBPS)
+            else:
+                transcode_audio_to_mp3(orig_path, audio_final, TARGET_KBPS)
+            public_url = upload_to_dropbox(audio_final, dropbox_dest)
+        tempo_preparo = time.perf_counter() - stage_started
 
         # Envia ao Transkriptor
         order_id = await send_to_transkriptor(
@@ -289,39 +785,168 @@ async def upload(processo_id: str,
         # Grava no Supabase com a nova estrutura
         row = supabase_insert(
             processo_id=processo_id,
-            filename=f"{safe_name}.mp3",
+            filename=dropbox_filename,
             order_id=order_id,
             status="Em Andamento",
             conteudo="",  # Será preenchido quando a transcrição for concluída
             dropbox_url=public_url,
-            dropbox_filename=f"{safe_name}.mp3",
-            tipo_transcricao=tipo_transcricao or ""
+            dropbox_filename=dropbox_filename,
+            tipo_transcricao=tipo_transcricao or "",
+            audio_pipeline=pipeline,
+            duracao_audio=duration_s,
+            previsao_conclusao=prediction["eta"] or "",
+            tempo_preparo=tempo_preparo
         )
 
+        logger.info("Upload processado e enviado ao Transkriptor", extra={
+            "processo_id": processo_id,
+            "order_id": order_id,
+            "audio_pipeline": pipeline,
+            "source_codec": plan["codec"],
+            "source_kbps": plan["bitrate_kbps"],
+            "dropbox_filename": dropbox_filename,
+            "duration_s": duration_s,
+            "eta": prediction["eta"],
+            "preflight_warnings": report["warnings"],
+        })
+
         return JSONResponse({
             "message": "Arquivo processado e enviado ao Transkriptor.",
             "dropbox_url": public_url,
             "order_id": order_id,
             "supabase_row": row,
-            "target_kbps": TARGET_KBPS
+            "target_kbps": TARGET_KBPS,
+            "audio_pipeline": pipeline,
+            "source_codec": plan["codec"],
+            "source_kbps": plan["bitrate_kbps"],
+            "preflight": preflight
         })
 
-    except HTTPException:
+    except HTTPException as e:
+        logger.warning(f"Upload rejeitado: {e.detail}", extra={"processo_id": processo_id, "status_code": e.status_code})
         raise
     except subprocess.CalledProcessError as e:
+        logger.error(f"Erro no ffmpeg: {e}", extra={"processo_id": processo_id})
         raise HTTPException(status_code=500, detail=f"Erro no ffmpeg: {e}")
     except Exception as e:
+        logger.exception(f"Falha no processamento: {e}", extra={"processo_id": processo_id})
         raise HTTPException(status_code=500, detail=f"Falha no processamento: {e}")
     finally:
         # limpeza
-        for p in (orig_path, mp3_final):
+        for p in (orig_path, audio_final):
             try:
-                if p.exists():
+                if p and p.exists():
                     p.unlink()
             except Exception:
                 pass
 
 
+@app.get("/jobs/{job_id}", tags=["Jobs"])
+async def job_status(job_id: str):
+    """
+    Andamento de um upload no modo fila: o job 'transcode' e os estágios
+    seguintes encadeados a ele ('transfer').
+    """
+    if not job_queue:
+        raise HTTPException(status_code=404, detail="Modo fila desativado (JOB_QUEUE_ENABLED=false).")
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="job_id inválido.")
+
+    jobs = job_queue.get(job_id)
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+
+    stages = [
+        {
+            "id": str(j["id"]),
+            "tipo": j["tipo"],
+            "status": j["status"],
+            "tentativas": j["tentativas"],
+            "erro": j["ultimo_erro"],
+            "resultado": j["resultado"],
+            "updated_at": j["updated_at"].isoformat() if j["updated_at"] else None,
+        }
+        for j in jobs
+    ]
+    last = stages[-1]
+    if any(st["status"] == "erro" for st in stages):
+        overall = "erro"
+    elif last["tipo"] == "transfer" and last["status"] == "concluido":
+        overall = "concluido"
+    else:
+        overall = "processando"
+    return {"job_id": job_id, "status": overall, "stages": stages}
+
+
+@app.get("/transcricoes/{transcricao_id}/conteudo", tags=["Transcrições"])
+async def transcricao_conteudo(transcricao_id: str,
+                               request: Request,
+                               cursor: Optional[int] = None,
+                               limit: Optional[int] = None):
+    """
+    Conteúdo da transcrição, pensado para sessões longas:
+      - sem cursor: texto completo (text/plain), com gzip/br e suporte a Range (bytes)
+      - com cursor: página JSON de segmentos (cursor = índice do primeiro segmento)
+      - ETag + If-None-Match → 304 sem reler o conteúdo
+    """
+    try:
+        uuid.UUID(transcricao_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="transcricao_id inválido.")
+
+    page = None
+    if cursor is not None:
+        limit = max(1, min(limit or TRANSCRIPT_PAGE_SEGMENTS, 200))
+        cursor = max(0, cursor)
+        page = (cursor, limit)
+
+    etag, rendered = load_transcript(transcricao_id, request.headers.get("if-none-match"), page)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if rendered is None:
+        return Response(status_code=304, headers=headers)
+
+    if page:
+        total = len(rendered.segments)
+        next_cursor = cursor + limit if cursor + limit < total else None
+        payload = {
+            "transcricao_id": transcricao_id,
+            "cursor": cursor,
+            "next_cursor": next_cursor,
+            "total_segments": total,
+            "segments": rendered.segments[cursor:cursor + limit],
+        }
+        body, encoding = encode_payload(payload, request.headers.get("accept-encoding"))
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    headers["Accept-Ranges"] = "bytes"
+    total = len(rendered.body)
+    try:
+        byte_range = parse_range(request.headers.get("range"), total)
+    except ValueError:
+        headers["Content-Range"] = f"bytes */{total}"
+        return Response(status_code=416, headers=headers)
+
+    if byte_range:
+        # Range é servido sem compressão (offsets referem-se ao texto UTF-8 original)
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+        return Response(content=rendered.body[start:end + 1], status_code=206,
+                        media_type="text/plain; charset=utf-8", headers=headers)
+
+    encoding = negotiate_encoding(request.headers.get("accept-encoding")) if total >= MIN_COMPRESS_BYTES else None
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=rendered.encoded_body(encoding), media_type="text/plain; charset=utf-8", headers=headers)
+
+
 @app.get("/status", tags=["Health"])
 async def status(deep: bool = False):
     """
@@ -336,6 +961,13 @@ async def status(deep: bool = False):
         "deep_checks": {}
     }
 
+    if log_handler:
+        details["log_shipper"] = log_handler.stats()
+    details["transcript_cache"] = transcript_cache.stats()
+    details["cost_model"] = cost_model.stats()
+    if RECONCILE_ENABLED:
+        details["reconcile"] = reconciler.last_run
+
     if deep:
         # ffmpeg
         try:
@@ -0,0 +1,143 @@
+"""
+Benchmark: encode → upload sequencial (fluxo antigo) vs. encode com upload em streaming.
+
+Usa stand-ins locais: o áudio de entrada é gerado pelo próprio ffmpeg (ruído rosa, que
+é caro de encodar) e o Dropbox é substituído por um cliente falso que simula a banda
+de upload com sleep proporcional ao tamanho de cada bloco.
+
+Uso:
+  python bench_stream_upload.py
+  python bench_stream_upload.py --duration 3600 --bandwidth 0.5 --chunk-mb 1
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from streaming import iter_process_output, upload_chunks_to_dropbox
+
+
+class FakeDropbox:
+    """Simula a API de upload do Dropbox com banda limitada (MB/s)."""
+
+    def __init__(self, bandwidth_mb_s: float):
+        self.bytes_per_s = bandwidth_mb_s * 1024 * 1024
+        self.received = 0
+        self.calls = 0
+
+    def _transfer(self, data: bytes):
+        self.calls += 1
+        self.received += len(data)
+        time.sleep(len(data) / self.bytes_per_s)
+
+    def files_upload(self, data, path, mode=None):
+        self._transfer(data)
+        return SimpleNamespace(path_display=path, size=len(data))
+
+    def files_upload_session_start(self, data):
+        self._transfer(data)
+        return SimpleNamespace(session_id="fake-session")
+
+    def files_upload_session_append_v2(self, data, cursor):
+        assert cursor.offset == self.received, "offset fora de ordem"
+        self._transfer(data)
+
+    def files_upload_session_finish(self, data, cursor, commit):
+        assert cursor.offset == self.received, "offset fora de ordem"
+        self._transfer(data)
+        return SimpleNamespace(path_display=commit.path, size=self.received)
+
+
+def make_input(path: Path, duration: int) -> None:
+    cmd = [
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"anoisesrc=d={duration}:c=pink:r=44100:a=0.3",
+        "-ac", "2",
+        str(path)
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def encode_cmd(input_path: Path, kbps: int, output: str) -> list:
+    # Mesmos parâmetros de run_ffmpeg_extract_audio / ffmpeg_mp3_pipe_cmd no app.py
+    return [
+        "ffmpeg", "-y", "-nostdin", "-loglevel", "error",
+        "-i", str(input_path),
+        "-vn", "-ar", "44100", "-ac", "2",
+        "-b:a", f"{kbps}k",
+        "-f", "mp3",
+        output
+    ]
+
+
+def run_sequential(input_path: Path, workdir: Path, kbps: int, bandwidth: float) -> dict:
+    fake = FakeDropbox(bandwidth)
+    mp3_final = workdir / "final.mp3"
+    t0 = time.perf_counter()
+    subprocess.run(encode_cmd(input_path, kbps, str(mp3_final)), check=True)
+    t_encode = time.perf_counter() - t0
+    with mp3_final.open("rb") as f:
+        fake.files_upload(f.read(), "/bench.mp3")
+    total = time.perf_counter() - t0
+    return {"encode": t_encode, "upload": total - t_encode, "total": total, "bytes": fake.received, "calls": fake.calls}
+
+
+def run_streaming(input_path: Path, kbps: int, bandwidth: float, chunk_mb: float, buffered: int) -> dict:
+    fake = FakeDropbox(bandwidth)
+
+    def call(method, *args, **kwargs):
+        return getattr(fake, method)(*args, **kwargs)
+
+    t0 = time.perf_counter()
+    chunks = iter_process_output(
+        encode_cmd(input_path, kbps, "pipe:1"),
+        chunk_size=int(chunk_mb * 1024 * 1024),
+        max_buffered_chunks=buffered,
+    )
+    upload_chunks_to_dropbox(call, chunks, "/bench.mp3")
+    total = time.perf_counter() - t0
+    return {"total": total, "bytes": fake.received, "calls": fake.calls}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=int, default=1800, help="duração do áudio de teste em segundos (padrão: 1800)")
+    parser.add_argument("--kbps", type=int, default=64, help="bitrate-alvo do MP3 (padrão: 64)")
+    parser.add_argument("--bandwidth", type=float, default=1.0, help="banda de upload simulada em MB/s (padrão: 1.0)")
+    parser.add_argument("--chunk-mb", type=float, default=1.0, help="tamanho do bloco enviado ao Dropbox (padrão: 1)")
+    parser.add_argument("--buffered", type=int, default=4, help="blocos em memória entre ffmpeg e upload (padrão: 4)")
+    args = parser.parse_args()
+
+    try:
+        subprocess.run(["ffmpeg", "-version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    except Exception:
+        print("ffmpeg não encontrado no sistema. Instale o ffmpeg.")
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        input_path = workdir / "input.wav"
+        print(f"Gerando áudio de teste ({args.duration}s)...")
+        make_input(input_path, args.duration)
+
+        seq = run_sequential(input_path, workdir, args.kbps, args.bandwidth)
+        stream = run_streaming(input_path, args.kbps, args.bandwidth, args.chunk_mb, args.buffered)
+
+    ideal = max(seq["encode"], seq["upload"])
+    print()
+    print(f"MP3 gerado:            {seq['bytes'] / (1024 * 1024):.2f} MB")
+    print(f"Encode (isolado):      {seq['encode']:.2f}s")
+    print(f"Upload (isolado):      {seq['upload']:.2f}s  @ {args.bandwidth} MB/s")
+    print(f"Sequencial (atual):    {seq['total']:.2f}s  ({seq['calls']} chamada)")
+    print(f"Streaming:             {stream['total']:.2f}s  ({stream['calls']} chamadas de {args.chunk_mb} MB)")
+    print(f"Ideal max(enc, up):    {ideal:.2f}s")
+    print(f"Ganho:                 {seq['total'] / stream['total']:.2f}x")
+    if stream["bytes"] != seq["bytes"]:
+        print(f"ATENÇÃO: tamanhos diferentes (sequencial {seq['bytes']} vs streaming {stream['bytes']})")
+
+
+if __name__ == "__main__":
+    main()
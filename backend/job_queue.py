@@ -0,0 +1,243 @@
+import os
+import json
+import threading
+from typing import Optional
+import psycopg
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+
+# Funções SQL em supabase/migrations/20250126000002_create_jobs_queue.sql
+
+
+class JobQueue:
+    """
+    Cliente da fila de jobs no Postgres (conexão direta, fora do PostgREST).
+
+    Cada instância mantém uma conexão em autocommit; cada chamada é uma função SQL
+    (claim_jobs, heartbeat_job, complete_job, fail_job), então a concorrência entre
+    workers fica toda a cargo do FOR UPDATE SKIP LOCKED no banco.
+    """
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._conn: Optional[psycopg.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> psycopg.Connection:
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg.connect(self.dsn, autocommit=True, row_factory=dict_row)
+        return self._conn
+
+    def _fetch(self, sql: str, params: tuple) -> list:
+        with self._lock:
+            try:
+                with self._connection().cursor() as cur:
+                    cur.execute(sql, params)
+                    return cur.fetchall()
+            except psycopg.OperationalError:
+                # Conexão caiu (restart do banco, rede): reconecta uma vez
+                self.close()
+                with self._connection().cursor() as cur:
+                    cur.execute(sql, params)
+                    return cur.fetchall()
+
+    def close(self) -> None:
+        if self._conn is not None and not self._conn.closed:
+            self._conn.close()
+        self._conn = None
+
+    def enqueue(self, tipo: str, payload: dict, processo_id: Optional[str] = None,
+                parent_job_id: Optional[str] = None, max_tentativas: int = 3) -> str:
+        rows = self._fetch(
+            "SELECT enqueue_job(%s, %s, %s, %s, %s) AS id",
+            (tipo, Jsonb(payload), processo_id, parent_job_id, max_tentativas),
+        )
+        return str(rows[0]["id"])
+
+    def claim(self, worker_id: str, tipos: list, batch_size: int = 1, lease_seconds: int = 60) -> list:
+        return self._fetch(
+            "SELECT * FROM claim_jobs(%s, %s, %s, %s)",
+            (worker_id, list(tipos), batch_size, lease_seconds),
+        )
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: int = 60) -> bool:
+        rows = self._fetch("SELECT heartbeat_job(%s, %s, %s) AS ok", (job_id, worker_id, lease_seconds))
+        return bool(rows[0]["ok"])
+
+    def progress(self, job_id: str, worker_id: str, progresso: dict) -> bool:
+        """Checkpoint em resultado; FALSE se o job não pertence mais ao worker."""
+        rows = self._fetch("SELECT progress_job(%s, %s, %s) AS ok", (job_id, worker_id, Jsonb(progresso)))
+        return bool(rows[0]["ok"])
+
+    def complete(self, job_id: str, worker_id: str, resultado: Optional[dict] = None,
+                 next_job: Optional[tuple] = None, max_tentativas: int = 3) -> bool:
+        """
+        Conclui o job. Se next_job=(tipo, payload) for informado, o próximo estágio é
+        enfileirado na mesma transação (não existe janela em que o job sumiu da fila).
+        """
+        with self._lock:
+            conn = self._connection()
+            with conn.transaction(), conn.cursor() as cur:
+                cur.execute(
+                    "SELECT complete_job(%s, %s, %s) AS ok",
+                    (job_id, worker_id, Jsonb(resultado) if resultado is not None else None),
+                )
+                ok = bool(cur.fetchone()["ok"])
+                if ok and next_job:
+                    tipo, payload = next_job
+                    cur.execute(
+                        "SELECT enqueue_job(%s, %s, %s, %s, %s)",
+                        (tipo, Jsonb(payload), payload.get("processo_id"), job_id, max_tentativas),
+                    )
+                return ok
+
+    def fail(self, job_id: str, worker_id: str, error: str, retry: bool = True) -> Optional[str]:
+        rows = self._fetch("SELECT fail_job(%s, %s, %s, %s) AS status", (job_id, worker_id, error, retry))
+        return rows[0]["status"]
+
+    def failed_payloads(self, since_hours: int = 168) -> list:
+        """Jobs que terminaram em 'erro' recentemente (para limpar o staging que deixaram)."""
+        return self._fetch(
+            "SELECT id, payload FROM jobs WHERE status = 'erro' AND updated_at > NOW() - make_interval(hours => %s)",
+            (since_hours,),
+        )
+
+    def estimate_wait(self) -> dict:
+        """
+        Espera prevista na fila para um job novo, por estágio: jobs à frente × duração
+        média recente ÷ workers ativos (mínimo 1). Estágio sem histórico conta 0.
+        """
+        estagios = {}
+        for row in self._fetch("SELECT * FROM estimate_queue_wait()", ()):
+            if row["media_s"] is None:
+                continue
+            estagios[row["tipo"]] = round(float(row["na_fila"]) * row["media_s"] / max(1, row["workers"]), 1)
+        return {"total_s": round(sum(estagios.values()), 1), "estagios": estagios}
+
+    def get(self, job_id: str) -> Optional[dict]:
+        rows = self._fetch(
+            "SELECT id, tipo, status, resultado, processo_id, parent_job_id, tentativas, ultimo_erro, "
+            "created_at, updated_at FROM jobs WHERE id = %s OR parent_job_id = %s ORDER BY created_at",
+            (job_id, job_id),
+        )
+        return rows or None
+
+
+class Heartbeat:
+    """
+    Renova o lease de um job em background enquanto o handler roda.
+    Usa conexão própria para não disputar com a conexão do worker.
+    """
+
+    def __init__(self, dsn: str, job_id: str, worker_id: str, lease_seconds: int):
+        self.queue = JobQueue(dsn)
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{job_id}", daemon=True)
+
+    def _run(self) -> None:
+        interval = max(1.0, self.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            try:
+                if not self.queue.heartbeat(self.job_id, self.worker_id, self.lease_seconds):
+                    self.lost.set()
+                    return
+            except Exception as e:
+                print(f"[jobs] falha no heartbeat do job {self.job_id}: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self.queue.close()
+        return False
+
+
+def _self_test(dsn: str) -> None:
+    """Smoke test contra um Postgres local (vazio) com a migração aplicada."""
+    q = JobQueue(dsn)
+    # claim_jobs não filtra por payload: com outros jobs na tabela, o teste os reservaria
+    # para workers fictícios (e incrementaria as tentativas deles)
+    if q._fetch("SELECT COUNT(*) AS n FROM jobs", ())[0]["n"]:
+        q.close()
+        raise SystemExit("Self-test recusado: a tabela jobs não está vazia (use um banco só para testes).")
+
+    marker = f"self-test-{os.getpid()}"
+    try:
+        _run_self_test(q, dsn, marker)
+    finally:
+        with q._connection().cursor() as cur:
+            cur.execute("DELETE FROM jobs WHERE payload->>'marker' = %s", (marker,))
+        q.close()
+
+
+def _run_self_test(q: JobQueue, dsn: str, marker: str) -> None:
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    ids = {q.enqueue("transcode", {"marker": marker, "n": i}) for i in range(10)}
+
+    # Vários workers em paralelo nunca recebem o mesmo job
+    def _claim(n):
+        worker = JobQueue(dsn)
+        try:
+            return [str(j["id"]) for j in worker.claim(f"w{n}", ["transcode"], batch_size=3, lease_seconds=1)
+                    if j["payload"].get("marker") == marker]
+        finally:
+            worker.close()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        claimed = [jid for batch in pool.map(_claim, range(4)) for jid in batch]
+    assert len(claimed) == len(set(claimed)), "job reservado por dois workers"
+    assert set(claimed) <= ids
+
+    # Lease expira → outro worker retoma; o dono antigo não consegue mais concluir
+    victim = claimed[0]
+    time.sleep(1.5)
+    retaken = [j for j in q.claim("w-rescue", ["transcode"], batch_size=50, lease_seconds=30)
+               if j["payload"].get("marker") == marker]
+    assert victim in {str(j["id"]) for j in retaken}, "lease vencido não foi retomado"
+    assert not any(q.heartbeat(victim, f"w{n}", 30) for n in range(4)), "dono antigo manteve o lease"
+    assert not q.complete(victim, "w-inexistente")
+
+    # Conclusão encadeia o próximo estágio
+    for j in retaken:
+        assert q.complete(str(j["id"]), "w-rescue", {"ok": True, "duracao_s": 10},
+                          next_job=("transfer", {"marker": marker}), max_tentativas=5)
+    transfer = q.claim("w-transfer", ["transfer"], batch_size=50, lease_seconds=30)
+    transfer = [j for j in transfer if j["payload"].get("marker") == marker]
+    assert transfer and all(j["parent_job_id"] and j["max_tentativas"] == 5 for j in transfer)
+
+    # Checkpoint sobrevive ao retry e é mesclado na conclusão
+    first = str(transfer[0]["id"])
+    assert q.progress(first, "w-transfer", {"order_id": "o-1"})
+    assert not q.progress(first, "w-outro", {"order_id": "o-2"})
+    assert q.fail(first, "w-transfer", "erro de teste") == "pendente"
+    assert q.fail(str(transfer[1]["id"]), "w-transfer", "erro definitivo", retry=False) == "erro"
+    assert q.complete(str(transfer[2]["id"]), "w-transfer", {"ok": True})
+    failed = {str(j["id"]) for j in q.failed_payloads()}
+    assert first not in failed and str(transfer[1]["id"]) in failed
+    with q._connection().cursor() as cur:
+        cur.execute("UPDATE jobs SET proxima_tentativa_em = NOW() WHERE id = %s", (first,))
+    again = [j for j in q.claim("w-retry", ["transfer"], batch_size=50, lease_seconds=30) if str(j["id"]) == first]
+    assert again and again[0]["resultado"] == {"order_id": "o-1"}
+    assert q.complete(first, "w-retry", {"transcricao_id": "t-1"})
+    assert q.get(first)[0]["resultado"] == {"order_id": "o-1", "transcricao_id": "t-1"}
+
+    # Espera prevista: 3 transcodes à frente × 10 s ÷ 1 worker ativo (w-rescue)
+    for i in range(3):
+        q.enqueue("transcode", {"marker": marker, "fila": i})
+    wait = q.estimate_wait()
+    assert wait["estagios"]["transcode"] == 30.0, wait
+
+    print(json.dumps({"ok": True, "claimed": len(claimed), "retaken": len(retaken), "wait": wait}))
+
+
+if __name__ == "__main__":
+    _self_test(os.getenv("DATABASE_URL", "postgresql://localhost/honsha_jobs"))
@@ -0,0 +1,288 @@
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import subprocess
+from pathlib import Path
+from fastapi import HTTPException
+
+# Reaproveita config, clientes (Dropbox/Supabase) e etapas do pipeline do app
+import app as backend
+from job_queue import JobQueue, Heartbeat
+
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# Varredura do staging deixado por jobs em 'erro' (inclusive os que expiraram no claim_jobs)
+JOB_STAGING_SWEEP_SECONDS = float(os.getenv("JOB_STAGING_SWEEP_SECONDS", "3600"))
+
+
+class LeaseLost(Exception):
+    """O job passou para outro worker; parar antes do próximo efeito externo."""
+
+
+def _remove(path) -> None:
+    try:
+        if path and Path(path).exists():
+            Path(path).unlink()
+    except Exception:
+        pass
+
+
+def staging_files(job_id: str, payload: dict) -> list:
+    """Arquivos do staging que um job (ou o estágio anterior dele) pode ter deixado."""
+    paths = [payload.get("input_path"), payload.get("audio_path")]
+    paths += backend.JOB_STAGING_DIR.glob(f"audio-{job_id}.*")
+    return [Path(p) for p in paths if p]
+
+
+def sweep_staging(queue: JobQueue) -> int:
+    """Remove o staging de jobs que terminaram em 'erro'. Retorna quantos arquivos apagou."""
+    removed = 0
+    for job in queue.failed_payloads():
+        for path in staging_files(str(job["id"]), job["payload"] or {}):
+            if path.exists():
+                _remove(path)
+                removed += 1
+    return removed
+
+
+# =============================================================================
+# Estágios
+# =============================================================================
+def handle_transcode(job: dict, checkpoint):
+    """
+    Estágio CPU: escolhe o pipeline (passthrough/remux/transcode) e gera o áudio final
+    no JOB_STAGING_DIR. Retorna (resultado, próximo job 'transfer', arquivos a remover).
+    """
+    payload = job["payload"]
+    input_path = Path(payload["input_path"])
+    if not input_path.exists():
+        raise FileNotFoundError(f"Arquivo de entrada não encontrado no staging: {input_path}")
+
+    backend.ensure_ffmpeg()
+    plan = backend.plan_audio_pipeline(backend.probe_media(input_path), input_path)
+    pipeline = plan["pipeline"]
+    started = time.perf_counter()
+
+    if pipeline == "passthrough":
+        audio_path = input_path
+    else:
+        audio_path = backend.JOB_STAGING_DIR / f"audio-{job['id']}{plan['ext']}"
+        if pipeline == "remux":
+            backend.remux_audio_stream(input_path, audio_path, plan["codec"])
+        else:
+            # ffmpeg CLI serve tanto para vídeo quanto para áudio
+            backend.run_ffmpeg_extract_audio(input_path, audio_path, backend.TARGET_KBPS)
+    # Primeira parte do tempo de preparo; o transfer soma o upload ao Dropbox
+    preparo_s = round(time.perf_counter() - started, 2)
+
+    resultado = {
+        "audio_pipeline": pipeline,
+        "source_codec": plan["codec"],
+        "source_kbps": plan["bitrate_kbps"],
+        "preparo_s": preparo_s,
+    }
+    next_payload = {
+        **payload,
+        "audio_path": str(audio_path),
+        "ext": plan["ext"],
+        "audio_pipeline": pipeline,
+        "preparo_s": preparo_s,
+    }
+    # O original só pode sair do staging se o passthrough não for reaproveitá-lo
+    cleanup = [] if pipeline == "passthrough" else [input_path]
+    return resultado, ("transfer", next_payload), cleanup
+
+
+def find_transcricao_by_order(order_id: str) -> dict:
+    """Linha já gravada para o pedido (o insert pode ter passado sem o checkpoint)."""
+    resp = backend.supabase.table(backend.SUPABASE_TABLE).select("id").eq("order_id", order_id).limit(1).execute()
+    rows = getattr(resp, "data", None) or []
+    return rows[0] if rows else {}
+
+
+def handle_transfer(job: dict, checkpoint):
+    """
+    Estágio de rede: Dropbox → Transkriptor → Supabase.
+    Cada passo com efeito externo grava um checkpoint em jobs.resultado; num retry
+    (falha ou lease retomado por outro worker) os passos já feitos são pulados, então
+    o pedido pago no Transkriptor e a linha em transcricoes não se repetem.
+    """
+    payload = job["payload"]
+    progress = dict(job.get("resultado") or {})
+    audio_path = Path(payload["audio_path"])
+    dropbox_filename = f"{backend.safe_dropbox_name(payload.get('filename'))}{payload['ext']}"
+
+    public_url = progress.get("dropbox_url")
+    preparo_s = progress.get("preparo_s")
+    if not public_url:
+        if not audio_path.exists():
+            raise FileNotFoundError(f"Áudio não encontrado no staging: {audio_path}")
+        started = time.perf_counter()
+        public_url = backend.upload_to_dropbox(audio_path, f"/{dropbox_filename}")
+        # Tempo de preparo = transcode + upload, a mesma medida do /upload direto (sem a fila)
+        if payload.get("preparo_s") is not None:
+            preparo_s = round(payload["preparo_s"] + time.perf_counter() - started, 2)
+        checkpoint({"dropbox_url": public_url, "preparo_s": preparo_s})
+
+    order_id = progress.get("order_id")
+    if not order_id:
+        order_id = asyncio.run(backend.send_to_transkriptor(
+            file_url=public_url,
+            language=payload["language"],
+            service=payload["service"],
+            callback_url=backend.CALLBACK_URL,
+            reference=payload["reference"]
+        ))
+        checkpoint({"order_id": order_id})
+
+    transcricao_id = progress.get("transcricao_id")
+    if not transcricao_id and progress.get("order_id"):
+        transcricao_id = find_transcricao_by_order(order_id).get("id")
+        if transcricao_id:
+            checkpoint({"transcricao_id": transcricao_id})
+    if not transcricao_id:
+        row = backend.supabase_insert(
+            processo_id=payload["processo_id"],
+            filename=dropbox_filename,
+            order_id=order_id,
+            status="Em Andamento",
+            conteudo="",
+            dropbox_url=public_url,
+            dropbox_filename=dropbox_filename,
+            tipo_transcricao=payload.get("tipo_transcricao") or "",
+            audio_pipeline=payload.get("audio_pipeline") or "",
+            duracao_audio=payload.get("duration_s"),
+            previsao_conclusao=payload.get("eta") or "",
+            tempo_preparo=preparo_s
+        )
+        transcricao_id = row.get("id")
+        checkpoint({"transcricao_id": transcricao_id})
+
+    return {
+        "dropbox_url": public_url,
+        "order_id": order_id,
+        "transcricao_id": transcricao_id,
+    }, None, [audio_path]
+
+
+HANDLERS = {
+    "transcode": handle_transcode,
+    "transfer": handle_transfer,
+}
+
+
+# =============================================================================
+# Loop do worker
+# =============================================================================
+def run_job(queue: JobQueue, job: dict, worker_id: str, lease_seconds: int) -> None:
+    job_id = str(job["id"])
+    handler = HANDLERS[job["tipo"]]
+    started = time.perf_counter()
+    extra = {"job_id": job_id, "job_tipo": job["tipo"], "processo_id": str(job.get("processo_id") or ""),
+             "worker_id": worker_id, "tentativa": job["tentativas"]}
+
+    def checkpoint(progresso: dict) -> None:
+        if hb.lost.is_set() or not queue.progress(job_id, worker_id, progresso):
+            raise LeaseLost(f"job {job_id} não pertence mais a {worker_id}")
+
+    with Heartbeat(queue.dsn, job_id, worker_id, lease_seconds) as hb:
+        try:
+            resultado, next_job, cleanup = handler(job, checkpoint)
+        except LeaseLost:
+            # O novo dono retoma a partir dos checkpoints; nada a registrar aqui
+            backend.logger.warning("Lease perdido durante o job; interrompido antes do próximo passo", extra=extra)
+            return
+        except Exception as e:
+            # Erros de validação (4xx) não adiantam repetir
+            retry = not (isinstance(e, HTTPException) and e.status_code < 500)
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            if isinstance(e, subprocess.CalledProcessError):
+                detail = f"Erro no ffmpeg: {e}"
+            status = queue.fail(job_id, worker_id, detail, retry=retry)
+            if status == "erro":
+                # Sem novas tentativas: o staging deste job não será mais usado
+                for path in staging_files(job_id, job["payload"]):
+                    _remove(path)
+            backend.logger.error(f"Job {job['tipo']} falhou: {detail}", extra={**extra, "novo_status": status})
+            return
+
+    if hb.lost.is_set():
+        # Outro worker assumiu o job (lease expirou); descarta o resultado
+        backend.logger.warning("Lease perdido; resultado descartado", extra=extra)
+        return
+
+    resultado["duracao_s"] = round(time.perf_counter() - started, 2)
+    if queue.complete(job_id, worker_id, resultado, next_job=next_job, max_tentativas=backend.JOB_MAX_ATTEMPTS):
+        # Só apaga arquivos do staging depois de confirmar (um retry ainda precisaria deles)
+        for path in cleanup:
+            _remove(path)
+        backend.logger.info(f"Job {job['tipo']} concluído", extra={**extra, **resultado})
+    else:
+        backend.logger.warning("Job não pertence mais a este worker; conclusão ignorada", extra=extra)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker da fila de jobs (transcode/transfer)")
+    parser.add_argument("--tipos", default="transcode,transfer",
+                        help="tipos de job atendidos, separados por vírgula (padrão: transcode,transfer)")
+    parser.add_argument("--once", action="store_true", help="processa no máximo um job e sai")
+    args = parser.parse_args()
+
+    tipos = [t.strip() for t in args.tipos.split(",") if t.strip()]
+    unknown = set(tipos) - set(HANDLERS)
+    if unknown:
+        print(f"Tipos de job desconhecidos: {', '.join(sorted(unknown))}")
+        sys.exit(1)
+    if not backend.DATABASE_URL:
+        print("Falta DATABASE_URL no .env")
+        sys.exit(1)
+
+    worker_id = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+    queue = JobQueue(backend.DATABASE_URL)
+    backend.JOB_STAGING_DIR.mkdir(parents=True, exist_ok=True)
+    if backend.log_handler:
+        backend.log_handler.start()
+
+    # SIGTERM: termina o job atual e sai (o lease cobre o caso de morte abrupta)
+    stopping = {"value": False}
+    def _stop(*_):
+        stopping["value"] = True
+    signal.signal(signal.SIGTERM, _stop)
+
+    print(f"Worker {worker_id} atendendo: {', '.join(tipos)}")
+    next_sweep = 0.0
+    try:
+        while not stopping["value"]:
+            if time.monotonic() >= next_sweep:
+                try:
+                    removed = sweep_staging(queue)
+                    if removed:
+                        print(f"[jobs] staging: {removed} arquivos de jobs com erro removidos")
+                except Exception as e:
+                    print(f"[jobs] erro na limpeza do staging: {e}")
+                next_sweep = time.monotonic() + JOB_STAGING_SWEEP_SECONDS
+            try:
+                jobs = queue.claim(worker_id, tipos, batch_size=1, lease_seconds=backend.JOB_LEASE_SECONDS)
+            except Exception as e:
+                print(f"[jobs] erro ao reservar job: {e}")
+                jobs = []
+            for job in jobs:
+                run_job(queue, job, worker_id, backend.JOB_LEASE_SECONDS)
+            if args.once:
+                break
+            if not jobs:
+                time.sleep(JOB_POLL_SECONDS)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        queue.close()
+        if backend.log_handler:
+            backend.log_handler.close()
+        print("Worker encerrado.")
+
+
+if __name__ == "__main__":
+    main()
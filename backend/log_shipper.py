@@ -0,0 +1,192 @@
+import json
+import logging
+import random
+import threading
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+# Atributos padrão do LogRecord (o resto veio via extra= e vai para metadata)
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def _level_name(levelno: int) -> str:
+    """Nível do Python → valores aceitos pelo CHECK da tabela logs."""
+    if levelno >= logging.ERROR:
+        return "error"
+    if levelno >= logging.WARNING:
+        return "warn"
+    if levelno >= logging.INFO:
+        return "info"
+    return "debug"
+
+
+def _json_safe(metadata: dict) -> dict:
+    """
+    Serializa já na emissão (datetime/UUID/Path viram str, inclusive aninhados), para
+    que um registro com extra= não serializável não derrube o insert do lote inteiro.
+    """
+    try:
+        return json.loads(json.dumps(metadata, default=str, allow_nan=False))
+    except (TypeError, ValueError):
+        # Chaves não-str ou NaN/inf: guarda a representação textual
+        return {str(key): str(value) for key, value in metadata.items()}
+
+
+class SupabaseLogHandler(logging.Handler):
+    """
+    Handler de logging que envia registros para a tabela logs em lote.
+
+    - emit() só empilha num ring buffer em memória (nunca faz I/O, nunca bloqueia a request)
+    - uma thread em background descarrega o buffer com INSERT em lote quando atinge
+      batch_size registros ou a cada flush_interval segundos
+    - sob sobrecarga (buffer acima de high_watermark), debug/info são amostrados;
+      com o buffer cheio, o registro mais antigo é descartado
+    - stats() informa quantos registros foram enviados, amostrados e descartados
+      (inclusive os perdidos em INSERTs que falharam)
+    """
+
+    def __init__(self, client, table: str = "logs", capacity: int = 5000, batch_size: int = 200,
+                 flush_interval: float = 2.0, high_watermark: float = 0.75, sample_rate: float = 0.1,
+                 level: int = logging.INFO):
+        super().__init__(level=level)
+        self.client = client
+        self.table = table
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.high_watermark = int(capacity * high_watermark)
+        self.sample_rate = sample_rate
+
+        self._buffer = deque(maxlen=capacity)
+        self._buffer_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.shipped = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.failed_flushes = 0
+        self.failed_records = 0
+        self._dropped_reported = 0
+
+    # ------------------------------------------------------------------ buffer
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            row = self._to_row(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        with self._buffer_lock:
+            size = len(self._buffer)
+            # Sobrecarga: mantém warn/error, amostra debug/info
+            if size >= self.high_watermark and record.levelno < logging.WARNING:
+                if random.random() >= self.sample_rate:
+                    self.sampled_out += 1
+                    return
+            if size >= self.capacity:
+                # deque(maxlen) descarta o mais antigo ao anexar
+                self.dropped += 1
+            self._buffer.append(row)
+            size += 1
+
+        if size >= self.batch_size:
+            self._wakeup.set()
+
+    def _to_row(self, record: logging.LogRecord) -> dict:
+        metadata = {
+            "logger": record.name,
+            "module": record.module,
+            "func": record.funcName,
+            "line": record.lineno,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                metadata[key] = value
+        if record.exc_info:
+            metadata["exception"] = "".join(traceback.format_exception(*record.exc_info))[-4000:]
+        return {
+            "level": _level_name(record.levelno),
+            "message": record.getMessage(),
+            "metadata": _json_safe(metadata),
+            "created_at": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+        }
+
+    def _take_batch(self) -> list:
+        with self._buffer_lock:
+            n = min(self.batch_size, len(self._buffer))
+            batch = [self._buffer.popleft() for _ in range(n)]
+            lost = self.dropped + self.sampled_out
+            new_lost = lost - self._dropped_reported
+            self._dropped_reported = lost
+        if new_lost:
+            # Registro sintético para que descartes apareçam na própria tabela logs
+            batch.append({
+                "level": "warn",
+                "message": f"Log shipper descartou {new_lost} registros (buffer cheio/amostragem)",
+                "metadata": {"logger": "log_shipper", "dropped_total": self.dropped,
+                             "sampled_out_total": self.sampled_out},
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            })
+        return batch
+
+    # ------------------------------------------------------------------- flush
+    def flush(self) -> None:
+        """Envia tudo o que está no buffer (usado no desligamento)."""
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self._ship(batch)
+
+    def _ship(self, batch: list) -> None:
+        try:
+            self.client.table(self.table).insert(batch).execute()
+            self.shipped += len(batch)
+        except Exception as e:
+            # Não reempilha: evita crescer sem limite se o banco estiver fora
+            self.failed_flushes += 1
+            self.failed_records += len(batch)
+            print(f"[log_shipper] falha ao enviar {len(batch)} registros: {e}")
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            batch = self._take_batch()
+            while batch:
+                self._ship(batch)
+                if len(self._buffer) < self.batch_size:
+                    break
+                batch = self._take_batch()
+
+    # --------------------------------------------------------------- lifecycle
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="supabase-log-shipper", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+        super().close()
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "capacity": self.capacity,
+            "shipped": self.shipped,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "failed_flushes": self.failed_flushes,
+            "failed_records": self.failed_records,
+            "dropped_total": self.dropped + self.sampled_out + self.failed_records,
+        }
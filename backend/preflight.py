@@ -0,0 +1,244 @@
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from statistics import median
+from typing import Callable, Optional
+import numpy as np
+
+# Decodificação da amostra: mono 16 kHz PCM s16le (suficiente para nível/silêncio/clipping)
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.05
+
+
+class PreflightError(Exception):
+    """Arquivo rejeitado no pre-flight (mensagem pronta para o usuário)."""
+
+
+def _tag_duration(stream: dict) -> Optional[float]:
+    """DURATION das tags (MKV/WebM não preenchem stream.duration): "HH:MM:SS.fffffffff"."""
+    tags = stream.get("tags") or {}
+    value = tags.get("DURATION") or tags.get("DURATION-eng")
+    try:
+        h, m, sec = str(value).split(":")
+        return int(h) * 3600 + int(m) * 60 + float(sec)
+    except (TypeError, ValueError):
+        return None
+
+
+def media_duration(probe: dict) -> Optional[float]:
+    """
+    Duração do áudio em segundos: do stream de áudio ou, na falta, do container.
+    format.duration é a do stream mais longo (em MP4/MKV geralmente o vídeo, que em
+    gravações de tela/Teams passa alguns segundos do fim do áudio).
+    """
+    audio = [s for s in probe.get("streams") or [] if s.get("codec_type") == "audio"]
+    candidates = [s.get("duration") for s in audio] + [_tag_duration(s) for s in audio]
+    candidates.append((probe.get("format") or {}).get("duration"))
+    for value in candidates:
+        try:
+            duration = float(value)
+        except (TypeError, ValueError):
+            continue
+        if duration > 0:
+            return duration
+    return None
+
+
+def decode_sample(input_path: Path, offset: float, seconds: float) -> np.ndarray:
+    """Decodifica `seconds` de áudio a partir de `offset` (seek rápido antes do -i)."""
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error",
+        "-ss", f"{offset:.3f}",
+        "-i", str(input_path),
+        "-t", f"{seconds:.3f}",
+        "-map", "0:a:0",
+        "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE),
+        "-f", "s16le", "pipe:1"
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=15)
+    if result.returncode != 0:
+        detail = result.stderr.decode("utf-8", errors="replace").strip().splitlines()[-1:] or [""]
+        raise PreflightError(f"Não foi possível decodificar o áudio (arquivo corrompido?): {detail[0]}")
+    return np.frombuffer(result.stdout, dtype=np.int16)
+
+
+def analyze_samples(samples: np.ndarray, silence_dbfs: float) -> dict:
+    """
+    Análise vetorizada da amostra: nível RMS por quadro de 50 ms, fração de quadros
+    acima do limiar de silêncio, pico e fração de amostras saturadas (clipping).
+    """
+    if samples.size == 0:
+        return {"seconds": 0.0, "active_ratio": 0.0, "peak_dbfs": -120.0, "rms_dbfs": -120.0, "clip_ratio": 0.0}
+
+    x = samples.astype(np.float32) / 32768.0
+    frame = int(SAMPLE_RATE * FRAME_SECONDS)
+    n_frames = max(1, x.size // frame)
+    frames = x[:n_frames * frame].reshape(n_frames, -1) if x.size >= frame else x.reshape(1, -1)
+
+    frame_rms = np.sqrt(np.mean(np.square(frames), axis=1))
+    frame_dbfs = 20 * np.log10(np.maximum(frame_rms, 1e-6))
+    abs_x = np.abs(x)
+    return {
+        "seconds": round(x.size / SAMPLE_RATE, 2),
+        "active_ratio": float(np.mean(frame_dbfs > silence_dbfs)),
+        "peak_dbfs": float(20 * np.log10(max(float(abs_x.max()), 1e-6))),
+        "rms_dbfs": float(20 * np.log10(max(float(np.sqrt(np.mean(np.square(x)))), 1e-6))),
+        "clip_ratio": float(np.mean(abs_x >= 0.999)),
+    }
+
+
+def sample_offsets(duration: Optional[float], sample_seconds: float, windows: int) -> list:
+    """Janelas espalhadas pelo arquivo (início, meio, fim) para pegar truncamento e trechos mudos."""
+    if not duration or duration <= sample_seconds * windows:
+        return [0.0]
+    span = duration - sample_seconds
+    return [round(span * i / (windows - 1), 3) for i in range(windows)] if windows > 1 else [0.0]
+
+
+def decode_windows(input_path: Path, offsets: list, seconds: float) -> list:
+    with ThreadPoolExecutor(max_workers=min(len(offsets), 4)) as pool:
+        return list(pool.map(lambda off: decode_sample(input_path, off, seconds), offsets))
+
+
+def run_preflight(input_path: Path, probe: Optional[dict], sample_seconds: float = 4.0, windows: int = 3,
+                  silence_dbfs: float = -55.0, min_active_ratio: float = 0.02, clip_ratio_warn: float = 0.01,
+                  max_duration_s: Optional[float] = None, silence_windows: int = 12) -> dict:
+    """
+    Checagem rápida antes dos estágios pesados (ffmpeg completo, Dropbox, Transkriptor).
+    Levanta PreflightError para arquivo que o ffmpeg não decodifica, sem áudio ou mudo
+    (o silêncio só é confirmado com silence_windows janelas, ou o arquivo inteiro se curto).
+    Retorna duração e métricas da amostra; avisos (ex.: clipping, áudio mais curto que
+    a duração informada) vão em "warnings".
+    """
+    if not probe or not probe.get("format"):
+        raise PreflightError("Arquivo corrompido ou em formato não reconhecido.")
+    streams = probe.get("streams") or []
+    if not any(s.get("codec_type") == "audio" for s in streams):
+        raise PreflightError("O arquivo não possui faixa de áudio.")
+
+    duration = media_duration(probe)
+    if max_duration_s and duration and duration > max_duration_s:
+        raise PreflightError(
+            f"Duração de {duration / 60:.0f} min excede o limite de {max_duration_s / 60:.0f} min."
+        )
+
+    offsets = sample_offsets(duration, sample_seconds, windows)
+    samples = decode_windows(input_path, offsets, sample_seconds)
+    if not any(chunk.size for chunk in samples):
+        raise PreflightError("Não foi possível decodificar nenhum trecho de áudio do arquivo.")
+
+    warnings = []
+    # Janela que deveria ter áudio mas veio curta: a duração do container/estimativa (MP3 VBR
+    # sem cabeçalho Xing) passa do fim real do áudio, ou o arquivo está truncado. Só avisa;
+    # a rejeição fica para quando o ffmpeg de fato falha.
+    for offset, chunk in zip(offsets, samples):
+        expected = min(sample_seconds, (duration - offset) if duration else sample_seconds)
+        got = chunk.size / SAMPLE_RATE
+        if expected >= 1.0 and got < expected * 0.5:
+            warnings.append(f"O áudio termina antes da duração informada (~{offset:.0f}s de {duration or 0:.0f}s); "
+                            f"o arquivo pode estar truncado e a transcrição incompleta.")
+            break
+
+    metrics = analyze_samples(np.concatenate(samples), silence_dbfs)
+    if metrics["active_ratio"] < min_active_ratio:
+        # Amostra inicial muda: confirma com mais janelas (ou o arquivo todo, se curto) e só
+        # rejeita se nenhuma delas tiver fala
+        if not duration or duration <= sample_seconds * silence_windows:
+            extra = decode_windows(input_path, [0.0], duration or sample_seconds * silence_windows)
+        else:
+            extra = decode_windows(input_path, sample_offsets(duration, sample_seconds, silence_windows), sample_seconds)
+        if any(analyze_samples(chunk, silence_dbfs)["active_ratio"] >= min_active_ratio for chunk in extra if chunk.size):
+            warnings.append("Trechos longos de silêncio na amostra; confira se a gravação está completa.")
+        else:
+            raise PreflightError(
+                f"Áudio praticamente mudo (nível médio {metrics['rms_dbfs']:.0f} dBFS). Verifique a gravação."
+            )
+
+    if metrics["clip_ratio"] >= clip_ratio_warn:
+        warnings.append(f"Áudio saturado (clipping em {metrics['clip_ratio'] * 100:.1f}% da amostra); "
+                        f"a transcrição pode perder qualidade.")
+    if not duration:
+        warnings.append("Duração não informada pelo container; previsão de tempo aproximada.")
+
+    return {
+        "duration_s": round(duration, 2) if duration else None,
+        "sample": metrics,
+        "warnings": warnings,
+    }
+
+
+class CostModel:
+    """
+    Previsão de custo/ETA de um job a partir da duração do áudio.
+
+    O preparo local (pipeline de áudio até o link público no Dropbox, sem espera na
+    fila) usa um fator de tempo real por pipeline: a mediana dos tempos gravados em
+    transcricoes.tempo_preparo_segundos pelos nós de API e pelos workers, relida a
+    cada refresh_seconds via `loader`. O Transkriptor entra com um fator fixo
+    configurável e a espera na fila é somada por quem chama (modo fila).
+    """
+
+    DEFAULT_RTF = {"passthrough": 0.002, "remux": 0.005, "transcode": 0.03}
+
+    def __init__(self, transkriptor_rtf: float = 0.5, loader: Optional[Callable[[], list]] = None,
+                 refresh_seconds: float = 300, min_samples: int = 3):
+        self.transkriptor_rtf = transkriptor_rtf
+        self.loader = loader
+        self.refresh_seconds = refresh_seconds
+        self.min_samples = min_samples
+        # Valores iniciais conservadores; são substituídos pelas observações
+        self.rtf = dict(self.DEFAULT_RTF)
+        self.samples = {k: 0 for k in self.DEFAULT_RTF}
+        self._loaded_at: Optional[float] = None
+
+    def load(self, observations: list) -> None:
+        """observations: [{"pipeline", "duration_s", "elapsed_s"}, ...]"""
+        ratios = {k: [] for k in self.DEFAULT_RTF}
+        for obs in observations:
+            try:
+                duration, elapsed = float(obs["duration_s"]), float(obs["elapsed_s"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if obs.get("pipeline") in ratios and duration > 0 and elapsed >= 0:
+                ratios[obs["pipeline"]].append(elapsed / duration)
+        for pipeline, values in ratios.items():
+            self.samples[pipeline] = len(values)
+            self.rtf[pipeline] = median(values) if len(values) >= self.min_samples else self.DEFAULT_RTF[pipeline]
+
+    def refresh(self, force: bool = False) -> None:
+        """Relê as observações se o cache venceu; falha no loader mantém os fatores atuais."""
+        if not self.loader:
+            return
+        now = time.monotonic()
+        if not force and self._loaded_at is not None and now - self._loaded_at < self.refresh_seconds:
+            return
+        self._loaded_at = now
+        try:
+            self.load(self.loader())
+        except Exception as e:
+            print(f"[preflight] falha ao carregar observações do CostModel: {e}")
+
+    def predict(self, pipeline: str, duration_s: Optional[float], queue_wait_s: float = 0.0) -> dict:
+        if not duration_s:
+            return {"processing_s": None, "transcription_s": None, "queue_wait_s": None, "total_s": None, "eta": None}
+        self.refresh()
+        processing = duration_s * self.rtf.get(pipeline, self.rtf["transcode"])
+        transcription = duration_s * self.transkriptor_rtf
+        total = queue_wait_s + processing + transcription
+        eta = datetime.now(timezone.utc) + timedelta(seconds=total)
+        return {
+            "processing_s": round(processing, 1),
+            "transcription_s": round(transcription, 1),
+            "queue_wait_s": round(queue_wait_s, 1),
+            "total_s": round(total, 1),
+            "eta": eta.isoformat(),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "rtf": {k: round(v, 4) for k, v in self.rtf.items()},
+            "samples": dict(self.samples),
+            "transkriptor_rtf": self.transkriptor_rtf,
+        }
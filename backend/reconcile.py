@@ -0,0 +1,196 @@
+import os
+import sys
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import httpx
+
+# Status do Transkriptor que consideramos finais
+DONE_STATUSES = {"completed", "complete", "done", "finished", "success"}
+FAILED_STATUSES = {"failed", "error", "cancelled", "canceled"}
+
+
+def _parse_ts(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def format_transkriptor_content(content) -> str:
+    """Converte o conteúdo do Transkriptor (lista de falas) em texto, uma fala por linha."""
+    if isinstance(content, str):
+        return content
+    lines = []
+    for item in content or []:
+        if not isinstance(item, dict):
+            continue
+        text = (item.get("text") or "").strip()
+        if not text:
+            continue
+        speaker = item.get("Speaker") or item.get("speaker")
+        lines.append(f"{speaker}: {text}" if speaker else text)
+    return "\n".join(lines)
+
+
+class ReconciliationSweeper:
+    """
+    Varre transcrições presas em 'Em Andamento' e reconcilia com o Transkriptor.
+
+    - pagina por (created_at, id) usando o índice parcial de 'Em Andamento'
+    - consulta o Transkriptor com concorrência limitada
+    - aplica todas as mudanças da página num único RPC (apply_transcricao_reconciliation)
+    """
+
+    def __init__(self, supabase, api_key: str, status_url: str, stale_minutes: int = 30,
+                 give_up_hours: int = 48, page_size: int = 200, concurrency: int = 8):
+        self.supabase = supabase
+        self.api_key = api_key
+        self.status_url = status_url
+        self.stale_minutes = stale_minutes
+        self.give_up_hours = give_up_hours
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.last_run: Optional[dict] = None
+
+    # ------------------------------------------------------------ Supabase
+    def _list_page(self, cutoff: datetime, after: Optional[tuple]) -> list:
+        params = {
+            "cutoff_param": cutoff.isoformat(),
+            "after_created_at": after[0] if after else None,
+            "after_id": after[1] if after else None,
+            "page_size": self.page_size,
+        }
+        resp = self.supabase.rpc("list_stale_transcricoes", params).execute()
+        return getattr(resp, "data", None) or []
+
+    def _apply(self, updates: list) -> int:
+        if not updates:
+            return 0
+        resp = self.supabase.rpc("apply_transcricao_reconciliation", {"updates_param": updates}).execute()
+        return getattr(resp, "data", None) or 0
+
+    # -------------------------------------------------------- Transkriptor
+    async def _check_order(self, client: httpx.AsyncClient, sem: asyncio.Semaphore, row: dict,
+                           now: datetime) -> Optional[dict]:
+        """Retorna o update da linha, ou None se o pedido ainda está em processamento."""
+        created_at = _parse_ts(row["created_at"])
+        elapsed = int((now - created_at).total_seconds())
+        give_up = now - created_at > timedelta(hours=self.give_up_hours)
+
+        order_id = row.get("order_id")
+        if not order_id:
+            return {"id": row["id"], "status": "erro", "erro": "Transcrição sem order_id do Transkriptor"}
+
+        async with sem:
+            try:
+                r = await client.get(self.status_url.format(order_id=order_id))
+            except httpx.TransportError as e:
+                print(f"[reconcile] falha consultando order {order_id}: {e}")
+                return None
+
+        if r.status_code == 404:
+            if give_up:
+                return {"id": row["id"], "status": "erro", "erro": f"Pedido {order_id} não encontrado no Transkriptor"}
+            return None
+        if r.status_code >= 400:
+            print(f"[reconcile] Transkriptor respondeu {r.status_code} para order {order_id}")
+            return None
+
+        try:
+            data = r.json()
+        except ValueError:
+            return None
+        status = str(data.get("status") or "").lower()
+        content = data.get("content")
+
+        if status in FAILED_STATUSES:
+            return {"id": row["id"], "status": "erro",
+                    "erro": f"Transkriptor: {data.get('message') or status}", "tempo_processamento": elapsed}
+        if status in DONE_STATUSES or (not status and content):
+            conteudo = format_transkriptor_content(content)
+            if conteudo:
+                return {"id": row["id"], "status": "concluido", "conteudo": conteudo,
+                        "erro": None, "tempo_processamento": elapsed}
+        if give_up:
+            return {"id": row["id"], "status": "erro",
+                    "erro": f"Sem resultado do Transkriptor após {self.give_up_hours}h", "tempo_processamento": elapsed}
+        return None
+
+    # ---------------------------------------------------------------- loop
+    async def sweep_once(self) -> dict:
+        now = datetime.now(timezone.utc)
+        cutoff = now - timedelta(minutes=self.stale_minutes)
+        stats = {"verificadas": 0, "concluidas": 0, "erros": 0, "atualizadas": 0, "paginas": 0}
+        sem = asyncio.Semaphore(self.concurrency)
+        headers = {"Authorization": f"Bearer {self.api_key}", "Accept": "application/json"}
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+
+        async with httpx.AsyncClient(timeout=60, headers=headers, limits=limits) as client:
+            after = None
+            while True:
+                page = await asyncio.to_thread(self._list_page, cutoff, after)
+                if not page:
+                    break
+                stats["paginas"] += 1
+                stats["verificadas"] += len(page)
+
+                results = await asyncio.gather(*(self._check_order(client, sem, row, now) for row in page))
+                updates = [u for u in results if u]
+                stats["concluidas"] += sum(1 for u in updates if u["status"] == "concluido")
+                stats["erros"] += sum(1 for u in updates if u["status"] == "erro")
+                stats["atualizadas"] += await asyncio.to_thread(self._apply, updates)
+
+                if len(page) < self.page_size:
+                    break
+                # Linhas atualizadas saem do índice parcial, mas o cursor continua válido
+                after = (page[-1]["created_at"], page[-1]["id"])
+
+        stats["executado_em"] = now.isoformat()
+        self.last_run = stats
+        return stats
+
+    async def run_forever(self, interval_seconds: float, stop: Optional[asyncio.Event] = None) -> None:
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            try:
+                stats = await self.sweep_once()
+                if stats["verificadas"]:
+                    print(f"[reconcile] {stats}")
+            except Exception as e:
+                print(f"[reconcile] erro na varredura: {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+
+def main():
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    load_dotenv()
+    supabase_url = os.getenv("SUPABASE_URL", "")
+    supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "") or os.getenv("SUPABASE_ANON_KEY", "")
+    api_key = os.getenv("TRANSKRIPTOR_API_KEY", "")
+    if not supabase_url or not supabase_key or not api_key:
+        print("Faltam SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY/SUPABASE_ANON_KEY ou TRANSKRIPTOR_API_KEY no .env")
+        sys.exit(1)
+
+    sweeper = ReconciliationSweeper(
+        create_client(supabase_url, supabase_key),
+        api_key=api_key,
+        status_url=os.getenv("TRANSKRIPTOR_STATUS_URL", "https://api.tor.app/developer/files/{order_id}/content"),
+        stale_minutes=int(os.getenv("RECONCILE_STALE_MINUTES", "30")),
+        give_up_hours=int(os.getenv("RECONCILE_GIVE_UP_HOURS", "48")),
+        page_size=int(os.getenv("RECONCILE_PAGE_SIZE", "200")),
+        concurrency=int(os.getenv("RECONCILE_CONCURRENCY", "8")),
+    )
+    if "--once" in sys.argv[1:]:
+        print(asyncio.run(sweeper.sweep_once()))
+    else:
+        try:
+            asyncio.run(sweeper.run_forever(float(os.getenv("RECONCILE_INTERVAL_SECONDS", "600"))))
+        except KeyboardInterrupt:
+            print("Sweeper encerrado.")
+
+
+if __name__ == "__main__":
+    main()
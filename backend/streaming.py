@@ -0,0 +1,103 @@
+import queue
+import subprocess
+import tempfile
+import threading
+from typing import Callable, Iterator
+import dropbox
+
+# Dropbox aceita até 150MB por chamada; 8MB mantém memória baixa e poucas requisições
+STREAM_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def iter_process_output(cmd: list, chunk_size: int = STREAM_CHUNK_SIZE, max_buffered_chunks: int = 4) -> Iterator[bytes]:
+    """
+    Roda o comando (ffmpeg escrevendo em pipe:1) e entrega o stdout em blocos de chunk_size.
+
+    Uma thread lê o pipe para uma fila limitada, então o ffmpeg continua encodando
+    enquanto o consumidor faz upload do bloco anterior. Se o processo terminar com
+    erro, levanta CalledProcessError depois do último bloco (antes de StopIteration),
+    de modo que o consumidor nunca confirma um arquivo incompleto.
+    """
+    stderr_file = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+    chunks = queue.Queue(maxsize=max_buffered_chunks)
+    done = object()
+
+    def _reader():
+        try:
+            while True:
+                data = proc.stdout.read(chunk_size)
+                if not data:
+                    break
+                chunks.put(data)
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            chunks.put(done)
+
+    reader = threading.Thread(target=_reader, name="ffmpeg-stdout-reader", daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+        returncode = proc.wait()
+        if returncode != 0:
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode("utf-8", errors="replace")[-2000:]
+            raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+    finally:
+        # Consumidor abortou (ex.: falha no upload): encerra o ffmpeg e libera o reader
+        if proc.poll() is None:
+            proc.kill()
+        while reader.is_alive():
+            try:
+                chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        proc.wait()
+        proc.stdout.close()
+        stderr_file.close()
+
+
+def upload_chunks_to_dropbox(call: Callable, chunks: Iterator[bytes], dropbox_dest_path: str):
+    """
+    Sobe um fluxo de bytes para o Dropbox via upload session (start/append/finish).
+
+    `call(nome_do_metodo, *args, **kwargs)` executa o método no cliente Dropbox
+    (permite renovar o token no meio do upload). O último bloco só é enviado junto
+    do finish, depois que o iterador terminou sem erro.
+    """
+    try:
+        return _upload_session(call, iter(chunks), dropbox_dest_path)
+    finally:
+        # Se o upload falhar no meio, fecha o gerador (encerra o ffmpeg na hora)
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+
+
+def _upload_session(call: Callable, chunks: Iterator[bytes], dropbox_dest_path: str):
+    mode = dropbox.files.WriteMode("overwrite")
+    pending = next(chunks, b"")
+    following = next(chunks, None)
+
+    # Arquivo pequeno (um bloco só): upload simples
+    if following is None:
+        return call("files_upload", pending, dropbox_dest_path, mode=mode)
+
+    session = call("files_upload_session_start", pending)
+    cursor = dropbox.files.UploadSessionCursor(session_id=session.session_id, offset=len(pending))
+    pending = following
+    for chunk in chunks:
+        call("files_upload_session_append_v2", pending, cursor)
+        cursor.offset += len(pending)
+        pending = chunk
+
+    commit = dropbox.files.CommitInfo(path=dropbox_dest_path, mode=mode)
+    return call("files_upload_session_finish", pending, cursor, commit)
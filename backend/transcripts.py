@@ -0,0 +1,209 @@
+import gzip
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional; sem ele servimos só gzip
+    brotli = None
+
+# Abaixo disso não compensa comprimir
+MIN_COMPRESS_BYTES = 1024
+
+
+class RenderedTranscript:
+    """
+    Transcrição já preparada para servir: texto em UTF-8, segmentos para paginação
+    e versões comprimidas (geradas sob demanda e guardadas junto).
+    """
+
+    def __init__(self, transcricao_id: str, etag: str, text: str, segment_chars: int):
+        self.transcricao_id = transcricao_id
+        self.etag = etag
+        self.body = text.encode("utf-8")
+        self.segments = split_segments(text, segment_chars)
+        self._compressed = {}
+
+    def encoded_body(self, encoding: Optional[str]) -> bytes:
+        if not encoding:
+            return self.body
+        if encoding not in self._compressed:
+            self._compressed[encoding] = compress(self.body, encoding)
+        return self._compressed[encoding]
+
+    @property
+    def size(self) -> int:
+        return len(self.body) * 2 + sum(len(b) for b in self._compressed.values())
+
+
+class TranscriptCache:
+    """LRU pequena, limitada por número de entradas e por bytes."""
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, transcricao_id: str, etag: str) -> Optional[RenderedTranscript]:
+        item = self._items.get(transcricao_id)
+        if item is None or item.etag != etag:
+            self.misses += 1
+            return None
+        self._items.move_to_end(transcricao_id)
+        self.hits += 1
+        return item
+
+    def put(self, item: RenderedTranscript) -> None:
+        self._items[item.transcricao_id] = item
+        self._items.move_to_end(item.transcricao_id)
+        self._evict()
+
+    def _evict(self) -> None:
+        # Mantém pelo menos a entrada mais recente, mesmo se sozinha passar do limite
+        while len(self._items) > 1 and (
+            len(self._items) > self.max_entries
+            or sum(i.size for i in self._items.values()) > self.max_bytes
+        ):
+            self._items.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._items),
+            "bytes": sum(i.size for i in self._items.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def split_segments(text: str, segment_chars: int) -> list:
+    """
+    Quebra a transcrição em segmentos de ~segment_chars, respeitando quebras de linha
+    (falas do Transkriptor vêm uma por linha). Linhas maiores que o limite são cortadas.
+    """
+    segments = []
+    current = []
+    current_len = 0
+    for line in text.splitlines(keepends=True):
+        while len(line) > segment_chars:
+            if current:
+                segments.append("".join(current))
+                current, current_len = [], 0
+            segments.append(line[:segment_chars])
+            line = line[segment_chars:]
+        if current_len + len(line) > segment_chars and current:
+            segments.append("".join(current))
+            current, current_len = [], 0
+        current.append(line)
+        current_len += len(line)
+    if current:
+        segments.append("".join(current))
+    return segments
+
+
+def make_etag(transcricao_id: str, updated_at: str, *parts) -> str:
+    """ETag fraco a partir de id + updated_at (não precisa ler o conteúdo para validar)."""
+    raw = ":".join([transcricao_id, updated_at or "", *[str(p) for p in parts]])
+    return f'W/"{hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Comparação fraca: ignora o prefixo W/
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == wanted:
+            return True
+    return False
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Escolhe a codificação de maior q-value no Accept-Encoding entre br e gzip
+    (empate → br). Codificação não listada herda o q de "*"; q=0 recusa.
+    Retorna None se nenhuma for aceita ou se o cliente preferir identity.
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.lower()] = q
+
+    supported = ["br", "gzip"] if brotli is not None else ["gzip"]
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in supported:
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    if best and accepted.get("identity", 0.0) > best_q:
+        return None
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    raise ValueError(f"Encoding não suportado: {encoding}")
+
+
+def encode_payload(payload: dict, accept_encoding: Optional[str]):
+    """Serializa um JSON e comprime se valer a pena. Retorna (bytes, encoding)."""
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    encoding = negotiate_encoding(accept_encoding) if len(data) >= MIN_COMPRESS_BYTES else None
+    return (compress(data, encoding) if encoding else data), encoding
+
+
+def parse_range(range_header: Optional[str], total: int):
+    """
+    Interpreta um único intervalo 'bytes=a-b' / 'bytes=a-' / 'bytes=-n'.
+    Retorna (start, end) inclusivo, ou None se não houver Range ou se ele não for
+    suportado/for malformado (multi-range, outra unidade): nesse caso o Range é
+    ignorado e o conteúdo sai inteiro com 200 (RFC 9110 §14.2).
+    Levanta ValueError só para intervalo válido mas insatisfazível (→ 416).
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_s, sep, end_s = spec.strip().partition("-")
+    try:
+        start = int(start_s) if start_s else None
+        end = int(end_s) if end_s else None
+    except ValueError:
+        return None
+    if not sep or (start is None and end is None) or (start is not None and end is not None and end < start):
+        return None
+
+    if start is None:
+        if end <= 0:
+            raise ValueError("Range inválido")
+        start, end = max(0, total - end), total - 1
+    else:
+        end = min(end if end is not None else total - 1, total - 1)
+    if start >= total:
+        raise ValueError("Range fora do conteúdo")
+    return start, end
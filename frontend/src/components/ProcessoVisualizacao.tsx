@@ -14,7 +14,7 @@ import ReactFlow, {
 } from 'reactflow';
 import 'reactflow/dist/style.css';
 import { Processo, Analise, supabase } from '../lib/supabase';
-import { transcriptionService } from '../lib/transcription';
+import { transcriptionService, TRANSCRICAO_META_COLUMNS } from '../lib/transcription';
 import { Clock, CheckCircle, XCircle, AlertCircle, Download, RefreshCw, Trash2, Square, Diamond, Circle, Save, Edit3, ChevronDown, FileImage, FileText, Zap, Maximize2, Copy } from 'lucide-react';
 import toast from 'react-hot-toast';
 import html2canvas from 'html2canvas';
@@ -40,6 +40,22 @@ interface Transcricao {
   dropbox_filename?: string;
 }
 
+// Metadados pelo Supabase; o conteúdo (pode ter MBs) vem do backend com compressão e ETag
+async function fetchTranscricaoComConteudo(processoId: string, tipoTranscricao?: string) {
+  let query = supabase
+    .from('transcricoes')
+    .select(TRANSCRICAO_META_COLUMNS)
+    .eq('processo_id', processoId);
+  if (tipoTranscricao) {
+    query = query.eq('tipo_transcricao', tipoTranscricao);
+  }
+  const { data, error } = await query.single();
+  if (error || !data) {
+    return { data: null, error };
+  }
+  return { data: await transcriptionService.withTranscriptContent(data as Transcricao), error: null };
+}
+
 interface AnaliseFluxo {
   id: number;
   processo_id: string;
@@ -741,12 +757,7 @@ export function ProcessoVisualizacao({ processo, analise, onStatusUpdate, onDele
           
           // Buscando transcrição do tipo especificado
           
-          const { data, error } = await supabase
-            .from('transcricoes')
-            .select('*')
-            .eq('processo_id', processo.id)
-            .eq('tipo_transcricao', tipoTranscricao)
-            .single();
+          const { data, error } = await fetchTranscricaoComConteudo(processo.id, tipoTranscricao);
 
           // Query executada para buscar transcrição
 
@@ -761,11 +772,7 @@ export function ProcessoVisualizacao({ processo, analise, onStatusUpdate, onDele
         } else if (processo.tipo_entrada === 'texto') {
           console.log('Processo do tipo texto, usando conteudo_texto do processo');
           // Verificar se já existe transcrição para este processo de texto
-          const { data: existingTranscricao } = await supabase
-            .from('transcricoes')
-            .select('*')
-            .eq('processo_id', processo.id)
-            .single();
+          const { data: existingTranscricao } = await fetchTranscricaoComConteudo(processo.id);
           
           let textoTranscricao: Transcricao;
           
@@ -952,12 +959,7 @@ export function ProcessoVisualizacao({ processo, analise, onStatusUpdate, onDele
     const fetchTranscricaoEstadoAtual = async () => {
       setLoadingTranscricaoEstadoAtual(true);
       try {
-        const { data, error } = await supabase
-          .from('transcricoes')
-          .select('*')
-          .eq('processo_id', processo.id)
-          .eq('tipo_transcricao', 'Estado Atual')
-          .single();
+        const { data, error } = await fetchTranscricaoComConteudo(processo.id, 'Estado Atual');
 
         if (!error && data) {
           setTranscricaoEstadoAtual(data);
@@ -982,12 +984,7 @@ export function ProcessoVisualizacao({ processo, analise, onStatusUpdate, onDele
     const fetchTranscricaoEstadoFuturo = async () => {
       setLoadingTranscricaoEstadoFuturo(true);
       try {
-        const { data, error } = await supabase
-          .from('transcricoes')
-          .select('*')
-          .eq('processo_id', processo.id)
-          .eq('tipo_transcricao', 'Estado Futuro')
-          .single();
+        const { data, error } = await fetchTranscricaoComConteudo(processo.id, 'Estado Futuro');
 
         if (!error && data) {
           setTranscricaoEstadoFuturo(data);
@@ -1098,12 +1095,7 @@ export function ProcessoVisualizacao({ processo, analise, onStatusUpdate, onDele
         try {
           let tipoTranscricao = 'Analise Inicial';
           
-          const { data: transcricaoData } = await supabase
-            .from('transcricoes')
-            .select('*')
-            .eq('processo_id', processo.id)
-            .eq('tipo_transcricao', tipoTranscricao)
-            .single();
+          const { data: transcricaoData } = await fetchTranscricaoComConteudo(processo.id, tipoTranscricao);
 
           if (transcricaoData) {
             const hasChanged = !transcricao || 
@@ -1164,12 +1156,7 @@ export function ProcessoVisualizacao({ processo, analise, onStatusUpdate, onDele
     if (activeTab === 'estado_atual') {
       const refreshTranscricaoEstadoAtual = async () => {
         try {
-          const { data: transcricaoData } = await supabase
-            .from('transcricoes')
-            .select('*')
-            .eq('processo_id', processo.id)
-            .eq('tipo_transcricao', 'Estado Atual')
-            .single();
+          const { data: transcricaoData } = await fetchTranscricaoComConteudo(processo.id, 'Estado Atual');
 
           if (transcricaoData) {
             const hasChanged = !transcricaoEstadoAtual || 
@@ -1205,12 +1192,7 @@ export function ProcessoVisualizacao({ processo, analise, onStatusUpdate, onDele
     if (activeTab === 'estado_futuro') {
       const refreshTranscricaoEstadoFuturo = async () => {
         try {
-          const { data: transcricaoData } = await supabase
-            .from('transcricoes')
-            .select('*')
-            .eq('processo_id', processo.id)
-            .eq('tipo_transcricao', 'Estado Futuro')
-            .single();
+          const { data: transcricaoData } = await fetchTranscricaoComConteudo(processo.id, 'Estado Futuro');
 
           if (transcricaoData) {
             const hasChanged = !transcricaoEstadoFuturo || 
@@ -1296,12 +1278,7 @@ export function ProcessoVisualizacao({ processo, analise, onStatusUpdate, onDele
     // Forçar a criação de um registro de transcrição com status "processando" imediatamente
     try {
       // Primeiro, verificar se já existe um registro
-      const { data: existingData, error: existingError } = await supabase
-        .from('transcricoes')
-        .select('*')
-        .eq('processo_id', processo.id)
-        .eq('tipo_transcricao', 'Estado Atual')
-        .single();
+      const { data: existingData, error: existingError } = await fetchTranscricaoComConteudo(processo.id, 'Estado Atual');
 
       // Se não existir registro ou ocorrer erro (registro não encontrado), criar um temporário
       if (existingError || !existingData) {
@@ -1337,12 +1314,7 @@ export function ProcessoVisualizacao({ processo, analise, onStatusUpdate, onDele
         attempts++;
         
         try {
-          const { data, error } = await supabase
-            .from('transcricoes')
-            .select('*')
-            .eq('processo_id', processo.id)
-            .eq('tipo_transcricao', 'Estado Atual')
-            .single();
+          const { data, error } = await fetchTranscricaoComConteudo(processo.id, 'Estado Atual');
 
           if (!error && data) {
             setTranscricaoEstadoAtual(data);
@@ -1373,12 +1345,7 @@ export function ProcessoVisualizacao({ processo, analise, onStatusUpdate, onDele
     // Forçar a criação de um registro de transcrição com status "processando" imediatamente
     try {
       // Primeiro, verificar se já existe um registro
-      const { data: existingData, error: existingError } = await supabase
-        .from('transcricoes')
-        .select('*')
-        .eq('processo_id', processo.id)
-        .eq('tipo_transcricao', 'Estado Futuro')
-        .single();
+      const { data: existingData, error: existingError } = await fetchTranscricaoComConteudo(processo.id, 'Estado Futuro');
 
       // Se não existir registro ou ocorrer erro (registro não encontrado), criar um temporário
       if (existingError || !existingData) {
@@ -1414,12 +1381,7 @@ export function ProcessoVisualizacao({ processo, analise, onStatusUpdate, onDele
         attempts++;
         
         try {
-          const { data, error } = await supabase
-            .from('transcricoes')
-            .select('*')
-            .eq('processo_id', processo.id)
-            .eq('tipo_transcricao', 'Estado Futuro')
-            .single();
+          const { data, error } = await fetchTranscricaoComConteudo(processo.id, 'Estado Futuro');
 
           if (!error && data) {
             setTranscricaoEstadoFuturo(data);
@@ -1,7 +1,7 @@
 import React, { useState, useRef } from 'react';
 import { Upload, Video, Music, Type, FileText } from 'lucide-react';
 import { supabase } from '../lib/supabase';
-import { transcriptionService } from '../lib/transcription';
+import { transcriptionService, TranscriptionQueuedError, UploadJobStatus } from '../lib/transcription';
 import toast from 'react-hot-toast';
 
 interface UploadSectionProps {
@@ -115,13 +115,33 @@ export function UploadSection({ processoId, tipoTranscricao, onUploadSuccess, co
         const filePath = await uploadFile(selectedFile!, processoId);
         
         // Start transcription process - backend will create the transcription record
+        // (no modo fila, só depois que o job 'transfer' termina)
+        const queueToast = `upload-job-${processoId}-${tipoTranscricao}`;
+        const onQueued = (job: UploadJobStatus | null) => {
+          const stage = job?.stages[job.stages.length - 1];
+          const etapa = stage?.tipo === 'transfer' ? 'enviando para transcrição' : 'processando o áudio';
+          toast.loading(job ? `Arquivo na fila: ${etapa}...` : 'Arquivo recebido, aguardando na fila...', { id: queueToast });
+        };
         try {
-          const orderId = await transcriptionService.startTranscription(selectedFile!, processoId, tipoTranscricao);
+          const orderId = await transcriptionService.startTranscription(selectedFile!, processoId, tipoTranscricao, onQueued);
           console.log('Transcrição iniciada com order_id:', orderId);
         } catch (error) {
+          if (error instanceof TranscriptionQueuedError) {
+            // Já está na fila: não pedir para reenviar (duplicaria o job)
+            toast.success('Arquivo na fila de processamento. A transcrição aparecerá aqui quando for enviada.', { id: queueToast });
+            setTextContent('');
+            setSelectedFile(null);
+            if (fileInputRef.current) {
+              fileInputRef.current.value = '';
+            }
+            onUploadSuccess();
+            return;
+          }
           console.error('Erro ao iniciar transcrição:', error);
+          toast.dismiss(queueToast);
           throw error;
         }
+        toast.dismiss(queueToast);
       }
 
       toast.success(`${tipoTranscricao} ${entryType === 'text' ? 'criado' : 'enviado'} com sucesso!`);
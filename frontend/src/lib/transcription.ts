@@ -53,15 +53,53 @@ export interface FlowAnalysisResult {
   sugestoes: string;
 }
 
+// Andamento de um upload no modo fila (GET /jobs/{job_id} do backend)
+export interface UploadJobStage {
+  id: string;
+  tipo: 'transcode' | 'transfer';
+  status: 'pendente' | 'processando' | 'concluido' | 'erro';
+  tentativas: number;
+  erro: string | null;
+  resultado: { order_id?: string; transcricao_id?: string } | null;
+  updated_at: string | null;
+}
+
+export interface UploadJobStatus {
+  job_id: string;
+  status: 'processando' | 'concluido' | 'erro';
+  stages: UploadJobStage[];
+}
+
+// Upload aceito pela fila que ainda não terminou dentro do tempo de espera.
+// Não é falha: reenviar criaria outro job (e outro pedido pago no Transkriptor).
+export class TranscriptionQueuedError extends Error {
+  constructor(public readonly jobId: string) {
+    super(`Upload ainda em processamento na fila (job ${jobId})`);
+    this.name = 'TranscriptionQueuedError';
+  }
+}
+
+// Colunas de transcricoes sem o conteudo (que pode ter MBs); o texto vem do backend
+// via fetchTranscriptContent (gzip/br + ETag)
+export const TRANSCRICAO_META_COLUMNS =
+  'id, processo_id, status, tempo_processamento, created_at, updated_at, dropbox_url, order_id, tipo_transcricao, dropbox_filename';
+
 export class TranscriptionService {
   private readonly API_BASE_URL = this.getApiBaseUrl();
+  private readonly JOB_POLL_INTERVAL_MS = 3000;
+  private readonly JOB_POLL_TIMEOUT_MS = 10 * 60 * 1000;
 
   private getApiBaseUrl(): string {
     // Usar variável de ambiente do Vite
     return import.meta.env.VITE_BACKEND_URL || 'https://apihonshabot.com.br';
   }
 
-  async startTranscription(file: File, processoId: string, tipoTranscricao?: string): Promise<string> {
+  async startTranscription(
+    file: File,
+    processoId: string,
+    tipoTranscricao?: string,
+    onQueued?: (job: UploadJobStatus | null) => void
+  ): Promise<string> {
     try {
       const formData = new FormData();
       formData.append('file', file);
@@ -88,6 +126,12 @@ export class TranscriptionService {
 
       const result = await response.json();
       console.log('Resposta da API externa:', result);
+
+      // Modo fila: o backend só enfileirou; o order_id sai do estágio 'transfer'
+      if (response.status === 202 && result.job_id) {
+        onQueued?.(null);
+        return await this.waitForUploadJob(result.job_id, onQueued);
+      }
       
       if (!result.order_id) {
         throw new Error('API externa não retornou um order_id válido');
@@ -105,6 +149,52 @@ export class TranscriptionService {
     }
   }
 
+  async getUploadJob(jobId: string): Promise<UploadJobStatus> {
+    const response = await fetch(`${this.API_BASE_URL}/jobs/${jobId}`, {
+      method: 'GET',
+      headers: { 'Accept': 'application/json' },
+    });
+
+    if (!response.ok) {
+      const errorText = await response.text().catch(() => 'Erro desconhecido');
+      throw new Error(`Erro ao consultar job de upload: ${response.status} - ${errorText}`);
+    }
+
+    return response.json();
+  }
+
+  // Acompanha o job até o 'transfer' gravar o order_id. Falhas de rede no polling não
+  // encerram a espera; job em 'erro' (tentativas esgotadas) vira exceção.
+  async waitForUploadJob(jobId: string, onProgress?: (job: UploadJobStatus) => void): Promise<string> {
+    const deadline = Date.now() + this.JOB_POLL_TIMEOUT_MS;
+
+    while (Date.now() < deadline) {
+      await new Promise((resolve) => setTimeout(resolve, this.JOB_POLL_INTERVAL_MS));
+
+      let job: UploadJobStatus;
+      try {
+        job = await this.getUploadJob(jobId);
+      } catch (error) {
+        console.warn('Falha ao consultar job de upload, tentando novamente:', error);
+        continue;
+      }
+      onProgress?.(job);
+
+      if (job.status === 'erro') {
+        const failed = job.stages.find((stage) => stage.status === 'erro');
+        throw new Error(`Processamento do upload falhou: ${failed?.erro || 'erro desconhecido'}`);
+      }
+
+      const transfer = job.stages.find((stage) => stage.tipo === 'transfer');
+      const orderId = transfer?.resultado?.order_id;
+      if (job.status === 'concluido' && orderId) {
+        return orderId;
+      }
+    }
+
+    throw new TranscriptionQueuedError(jobId);
+  }
+
   async checkTranscriptionStatus(transcriptionId: string): Promise<ExternalTranscriptionResponse> {
     try {
       console.log(`Consultando status: ${this.API_BASE_URL}/transcribe-status/${transcriptionId}`);
@@ -172,6 +262,71 @@ export class TranscriptionService {
     return { transcriptionId };
   }
 
+  // Cache local (ETag → conteúdo) para revalidar transcrições longas com 304
+  private transcriptCache = new Map<string, { etag: string; text: string }>();
+
+  async fetchTranscriptContent(transcricaoId: string): Promise<string> {
+    // O navegador negocia gzip/br sozinho; aqui só cuidamos do If-None-Match
+    const cached = this.transcriptCache.get(transcricaoId);
+    const response = await fetch(`${this.API_BASE_URL}/transcricoes/${transcricaoId}/conteudo`, {
+      method: 'GET',
+      headers: cached ? { 'If-None-Match': cached.etag } : {},
+    });
+
+    if (response.status === 304 && cached) {
+      return cached.text;
+    }
+
+    if (!response.ok) {
+      const errorText = await response.text().catch(() => 'Erro desconhecido');
+      throw new Error(`Erro ao buscar conteúdo da transcrição: ${response.status} - ${errorText}`);
+    }
+
+    const text = await response.text();
+    const etag = response.headers.get('ETag');
+    if (etag) {
+      this.transcriptCache.set(transcricaoId, { etag, text });
+    }
+    return text;
+  }
+
+  // Completa uma linha buscada com TRANSCRICAO_META_COLUMNS com o conteúdo.
+  // Só transcrições concluídas têm texto; se o backend falhar, lê a coluna no Supabase.
+  async withTranscriptContent<T extends { id: string; status: string }>(row: T): Promise<T & { conteudo: string }> {
+    if (row.status !== 'concluido') {
+      return { ...row, conteudo: '' };
+    }
+    try {
+      return { ...row, conteudo: await this.fetchTranscriptContent(row.id) };
+    } catch (error) {
+      console.warn('Backend indisponível para o conteúdo da transcrição, lendo do Supabase:', error);
+      const { data } = await supabase.from('transcricoes').select('conteudo').eq('id', row.id).single();
+      return { ...row, conteudo: data?.conteudo || '' };
+    }
+  }
+
+  async fetchTranscriptSegments(
+    transcricaoId: string,
+    cursor = 0,
+    limit?: number
+  ): Promise<{ segments: string[]; next_cursor: number | null; total_segments: number }> {
+    const params = new URLSearchParams({ cursor: String(cursor) });
+    if (limit) {
+      params.set('limit', String(limit));
+    }
+    const response = await fetch(`${this.API_BASE_URL}/transcricoes/${transcricaoId}/conteudo?${params}`, {
+      method: 'GET',
+      headers: { 'Accept': 'application/json' },
+    });
+
+    if (!response.ok) {
+      const errorText = await response.text().catch(() => 'Erro desconhecido');
+      throw new Error(`Erro ao buscar segmentos da transcrição: ${response.status} - ${errorText}`);
+    }
+
+    return response.json();
+  }
+
   async saveTranscription(processoId: string, transcription: TranscriptionResult, transcriptionId?: string): Promise<void> {
     const insertData: {
       processo_id: string;
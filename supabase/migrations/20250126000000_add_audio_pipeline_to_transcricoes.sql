@@ -0,0 +1,10 @@
+-- Registra qual caminho de processamento de áudio o backend usou no upload
+-- passthrough: arquivo original enviado sem alterações (codec/bitrate já aceitáveis)
+-- remux:       áudio separado do vídeo por stream copy, sem reencode
+-- transcode:   reencodado para MP3 no bitrate-alvo (TARGET_KBPS)
+
+ALTER TABLE transcricoes
+ADD COLUMN IF NOT EXISTS audio_pipeline TEXT
+CHECK (audio_pipeline IN ('passthrough', 'remux', 'transcode'));
+
+COMMENT ON COLUMN transcricoes.audio_pipeline IS 'Caminho de áudio usado no upload: passthrough, remux ou transcode';
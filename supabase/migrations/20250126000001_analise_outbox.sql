@@ -0,0 +1,366 @@
+-- Outbox para análise de transcrições pela API externa
+-- Os triggers deixam de fazer chamadas HTTP (extensão http) dentro da transação
+-- de INSERT/UPDATE em transcricoes: agora só gravam uma linha em analise_outbox.
+-- O worker Python (backend/analysis_worker.py) drena a fila em lotes e chama a API
+-- externa com concorrência e retries, reproduzindo a integração de cada trigger:
+--   webhook      → trigger_new_transcricao (INSERT em transcricoes): envelope
+--                  {headers, params, query, body} no webhook; não grava analise_fluxo
+--   api          → trigger_transcricao_external_api_analysis / trigger_external_api_analysis:
+--                  corpo de send_transcricao_to_api na URL do Vault; a API grava analise_fluxo
+--   api_completa → trigger_external_api_analysis_complete: idem, e o worker grava a
+--                  resposta via process_api_response_to_analise_fluxo
+
+-- Tabela da fila
+CREATE TABLE IF NOT EXISTS analise_outbox (
+  id BIGSERIAL PRIMARY KEY,
+  transcricao_id UUID NOT NULL REFERENCES transcricoes(id) ON DELETE CASCADE,
+  processo_id UUID NOT NULL REFERENCES processos(id) ON DELETE CASCADE,
+  integracao TEXT NOT NULL DEFAULT 'api' CHECK (integracao IN ('webhook', 'api', 'api_completa')),
+  -- URL fixa do trigger (webhook); NULL = external_api_url do Vault
+  api_url TEXT,
+  -- Conteúdo no momento do trigger (webhook envia o que foi inserido); NULL = conteúdo atual
+  conteudo TEXT,
+  status TEXT NOT NULL DEFAULT 'pendente' CHECK (status IN ('pendente', 'processando', 'concluido', 'erro')),
+  tentativas INTEGER NOT NULL DEFAULT 0,
+  proxima_tentativa_em TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  bloqueado_ate TIMESTAMPTZ,
+  ultimo_erro TEXT,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Índice para o worker encontrar rapidamente o que está pronto para processar
+CREATE INDEX IF NOT EXISTS idx_analise_outbox_fila
+  ON analise_outbox(status, proxima_tentativa_em)
+  WHERE status IN ('pendente', 'processando');
+
+-- No máximo um item em aberto por transcrição e integração (o trigger dispara em INSERT e UPDATE)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_analise_outbox_transcricao_aberta
+  ON analise_outbox(transcricao_id, integracao)
+  WHERE status IN ('pendente', 'processando');
+
+DROP TRIGGER IF EXISTS update_analise_outbox_updated_at ON analise_outbox;
+CREATE TRIGGER update_analise_outbox_updated_at BEFORE UPDATE ON analise_outbox
+  FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- Enfileira uma transcrição para análise (barato: um INSERT, sem rede)
+CREATE OR REPLACE FUNCTION enqueue_transcricao_analysis(
+  transcricao_id_param UUID,
+  processo_id_param UUID,
+  integracao_param TEXT DEFAULT 'api',
+  api_url_param TEXT DEFAULT NULL,
+  conteudo_param TEXT DEFAULT NULL
+)
+RETURNS VOID AS $$
+BEGIN
+  INSERT INTO analise_outbox (transcricao_id, processo_id, integracao, api_url, conteudo)
+  VALUES (transcricao_id_param, processo_id_param, integracao_param, api_url_param, conteudo_param)
+  ON CONFLICT (transcricao_id, integracao) WHERE status IN ('pendente', 'processando') DO NOTHING;
+END;
+$$ LANGUAGE plpgsql;
+
+-- URL da API externa no Vault (mesma fonte que send_transcricao_to_api usava)
+CREATE OR REPLACE FUNCTION get_external_api_url()
+RETURNS TEXT AS $$
+DECLARE
+  external_api_url TEXT;
+BEGIN
+  SELECT decrypted_secret INTO external_api_url
+  FROM vault.decrypted_secrets
+  WHERE name = 'external_api_url';
+  RETURN NULLIF(external_api_url, '');
+EXCEPTION
+  WHEN OTHERS THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Reserva um lote para o worker. FOR UPDATE SKIP LOCKED permite vários workers
+-- em paralelo sem disputa; itens 'processando' com lease vencido são retomados, ou
+-- vão para 'erro' se já esgotaram as tentativas (worker morrendo sempre no mesmo item).
+-- Todo item reservado é devolvido (LEFT JOIN): processo sem cliente não fica preso.
+DROP FUNCTION IF EXISTS claim_analise_outbox(INTEGER, INTEGER);
+CREATE OR REPLACE FUNCTION claim_analise_outbox(
+  batch_size INTEGER DEFAULT 20,
+  lease_seconds INTEGER DEFAULT 300,
+  max_tentativas INTEGER DEFAULT 5
+)
+RETURNS TABLE(
+  outbox_id BIGINT,
+  transcricao_id UUID,
+  processo_id UUID,
+  tentativas INTEGER,
+  integracao TEXT,
+  api_url TEXT,
+  enfileirado_em TIMESTAMPTZ,
+  conteudo TEXT,
+  tipo_transcricao TEXT,
+  processo_nome TEXT,
+  cliente_nome TEXT,
+  tipo_entrada TEXT
+) AS $$
+#variable_conflict use_column
+BEGIN
+  WITH expirados AS (
+    UPDATE analise_outbox o
+    SET status = 'erro',
+        bloqueado_ate = NULL,
+        ultimo_erro = COALESCE(o.ultimo_erro, 'Lease expirado após esgotar tentativas')
+    WHERE o.status = 'processando'
+      AND o.bloqueado_ate < NOW()
+      AND o.tentativas >= claim_analise_outbox.max_tentativas
+    RETURNING o.id, o.transcricao_id, o.processo_id, o.integracao, o.tentativas
+  )
+  INSERT INTO logs (level, message, metadata, created_at)
+  SELECT
+    'error',
+    'External API analysis failed: lease expirado após esgotar tentativas',
+    jsonb_build_object(
+      'outbox_id', e.id,
+      'transcricao_id', e.transcricao_id,
+      'processo_id', e.processo_id,
+      'integracao', e.integracao,
+      'tentativa', e.tentativas
+    ),
+    NOW()
+  FROM expirados e;
+
+  RETURN QUERY
+  WITH lote AS (
+    SELECT o.id
+    FROM analise_outbox o
+    WHERE (o.status = 'pendente' AND o.proxima_tentativa_em <= NOW())
+       OR (o.status = 'processando' AND o.bloqueado_ate < NOW())
+    ORDER BY o.proxima_tentativa_em
+    LIMIT batch_size
+    FOR UPDATE SKIP LOCKED
+  ),
+  reservados AS (
+    UPDATE analise_outbox o
+    SET status = 'processando',
+        tentativas = o.tentativas + 1,
+        bloqueado_ate = NOW() + make_interval(secs => lease_seconds)
+    FROM lote
+    WHERE o.id = lote.id
+    RETURNING o.id, o.transcricao_id, o.processo_id, o.tentativas, o.integracao,
+              o.api_url, o.conteudo, o.created_at
+  )
+  SELECT
+    r.id,
+    r.transcricao_id,
+    r.processo_id,
+    r.tentativas,
+    r.integracao,
+    COALESCE(r.api_url, get_external_api_url()),
+    r.created_at,
+    COALESCE(r.conteudo, t.conteudo),
+    t.tipo_transcricao,
+    p.nome,
+    c.nome,
+    p.tipo_entrada
+  FROM reservados r
+  LEFT JOIN transcricoes t ON t.id = r.transcricao_id
+  LEFT JOIN processos p ON p.id = r.processo_id
+  LEFT JOIN clientes c ON c.id = p.cliente_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger em transcricoes (substitui a versão com chamada HTTP síncrona)
+CREATE OR REPLACE FUNCTION trigger_transcricao_external_api_analysis()
+RETURNS TRIGGER AS $$
+DECLARE
+  processo_tipo_entrada TEXT;
+BEGIN
+  -- Verificar se a transcrição está concluída e tem conteúdo
+  IF NEW.status = 'concluido' AND NEW.conteudo IS NOT NULL AND NEW.conteudo != '' THEN
+    SELECT tipo_entrada
+    INTO processo_tipo_entrada
+    FROM processos
+    WHERE id = NEW.processo_id;
+
+    IF processo_tipo_entrada = 'texto' THEN
+      PERFORM enqueue_transcricao_analysis(NEW.id, NEW.processo_id, 'api');
+    END IF;
+  END IF;
+
+  RETURN NEW;
+EXCEPTION
+  WHEN OTHERS THEN
+    -- Log do erro mas não falha a inserção da transcrição
+    INSERT INTO logs (level, message, metadata, created_at)
+    VALUES (
+      'error',
+      'Erro ao enfileirar análise da transcrição: ' || SQLERRM,
+      jsonb_build_object(
+        'processo_id', NEW.processo_id,
+        'transcricao_id', NEW.id,
+        'error', SQLERRM,
+        'trigger_table', 'transcricoes'
+      ),
+      NOW()
+    );
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger simples de INSERT em transcricoes (substitui a versão com chamada HTTP).
+-- Mantém o destino e o formato de send_transcricao_to_external_api: envelope no webhook,
+-- com o conteúdo do momento do INSERT, e sem gravar analise_fluxo.
+CREATE OR REPLACE FUNCTION trigger_new_transcricao()
+RETURNS TRIGGER AS $$
+DECLARE
+  processo_tipo_entrada TEXT;
+BEGIN
+  SELECT tipo_entrada
+  INTO processo_tipo_entrada
+  FROM processos
+  WHERE id = NEW.processo_id;
+
+  IF processo_tipo_entrada = 'texto' THEN
+    PERFORM enqueue_transcricao_analysis(
+      NEW.id,
+      NEW.processo_id,
+      'webhook',
+      'https://sua-api-externa.com/webhook',  -- mesma URL de send_transcricao_to_external_api
+      COALESCE(NEW.conteudo, '')
+    );
+  END IF;
+
+  RETURN NEW;
+EXCEPTION
+  WHEN OTHERS THEN
+    INSERT INTO logs (level, message, metadata, created_at)
+    VALUES (
+      'error',
+      'Erro ao enfileirar análise da transcrição: ' || SQLERRM,
+      jsonb_build_object(
+        'transcricao_id', NEW.id,
+        'processo_id', NEW.processo_id,
+        'error', SQLERRM
+      ),
+      NOW()
+    );
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger em processos (versão completa) também passa a só enfileirar
+CREATE OR REPLACE FUNCTION trigger_external_api_analysis_complete()
+RETURNS TRIGGER AS $$
+DECLARE
+  transcricao_record RECORD;
+BEGIN
+  IF NEW.tipo_entrada = 'texto' THEN
+    SELECT t.id
+    INTO transcricao_record
+    FROM transcricoes t
+    WHERE t.processo_id = NEW.id
+      AND t.status = 'concluido'
+      AND t.conteudo IS NOT NULL
+      AND t.conteudo != ''
+    ORDER BY
+      CASE
+        WHEN t.tipo_transcricao = 'Analise Inicial' THEN 1
+        WHEN t.tipo_transcricao = 'Estado Atual' THEN 2
+        WHEN t.tipo_transcricao = 'Estado Futuro' THEN 3
+        ELSE 4
+      END,
+      t.created_at DESC
+    LIMIT 1;
+
+    IF FOUND THEN
+      PERFORM enqueue_transcricao_analysis(transcricao_record.id, NEW.id, 'api_completa');
+    END IF;
+  END IF;
+
+  RETURN NEW;
+EXCEPTION
+  WHEN OTHERS THEN
+    INSERT INTO logs (level, message, metadata, created_at)
+    VALUES (
+      'error',
+      'Erro ao enfileirar análise do processo: ' || SQLERRM,
+      jsonb_build_object(
+        'processo_id', NEW.id,
+        'error', SQLERRM
+      ),
+      NOW()
+    );
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger em processos (versão simples, ativado por enable_external_api_trigger()):
+-- também só enfileira; a API externa continua responsável por gravar analise_fluxo
+CREATE OR REPLACE FUNCTION trigger_external_api_analysis()
+RETURNS TRIGGER AS $$
+DECLARE
+  transcricao_record RECORD;
+BEGIN
+  IF NEW.tipo_entrada = 'texto' THEN
+    SELECT t.id
+    INTO transcricao_record
+    FROM transcricoes t
+    WHERE t.processo_id = NEW.id
+      AND t.status = 'concluido'
+      AND t.conteudo IS NOT NULL
+      AND t.conteudo != ''
+    ORDER BY
+      CASE
+        WHEN t.tipo_transcricao = 'Analise Inicial' THEN 1
+        WHEN t.tipo_transcricao = 'Estado Atual' THEN 2
+        WHEN t.tipo_transcricao = 'Estado Futuro' THEN 3
+        ELSE 4
+      END,
+      t.created_at DESC
+    LIMIT 1;
+
+    IF FOUND THEN
+      PERFORM enqueue_transcricao_analysis(transcricao_record.id, NEW.id, 'api');
+    END IF;
+  END IF;
+
+  RETURN NEW;
+EXCEPTION
+  WHEN OTHERS THEN
+    INSERT INTO logs (level, message, metadata, created_at)
+    VALUES (
+      'error',
+      'Erro ao enfileirar análise do processo: ' || SQLERRM,
+      jsonb_build_object(
+        'processo_id', NEW.id,
+        'error', SQLERRM
+      ),
+      NOW()
+    );
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON TABLE analise_outbox IS 'Fila (outbox) de transcrições aguardando análise pela API externa; drenada por backend/analysis_worker.py';
+COMMENT ON FUNCTION enqueue_transcricao_analysis(UUID, UUID, TEXT, TEXT, TEXT) IS 'Enfileira transcrição para análise assíncrona (sem chamada HTTP na transação)';
+COMMENT ON FUNCTION claim_analise_outbox(INTEGER, INTEGER, INTEGER) IS 'Reserva um lote da outbox com FOR UPDATE SKIP LOCKED e lease; lease vencido sem tentativas vira erro';
+COMMENT ON FUNCTION get_external_api_url() IS 'URL da API externa no Vault (external_api_url) ou NULL';
+
+-- Instruções de uso:
+-- 1. Os triggers existentes continuam com os mesmos nomes; apenas o corpo mudou
+--    para gravar em analise_outbox. Isso vale para todas as funções de trigger:
+--    trigger_new_transcricao, trigger_transcricao_external_api_analysis,
+--    trigger_external_api_analysis e trigger_external_api_analysis_complete.
+--    Nenhuma delas faz mais chamada HTTP dentro da transação, esteja o trigger
+--    ativado por padrão ou via enable_*_trigger().
+--    As funções manuais de teste (test_*) continuam chamando a API diretamente.
+--
+-- 2. Rodar o worker no backend:
+--    python analysis_worker.py
+--
+-- 3. Acompanhar a fila:
+--    SELECT status, COUNT(*) FROM analise_outbox GROUP BY status;
+--
+-- 4. Reprocessar itens com erro:
+--    UPDATE analise_outbox SET status = 'pendente', tentativas = 0, proxima_tentativa_em = NOW()
+--    WHERE status = 'erro';
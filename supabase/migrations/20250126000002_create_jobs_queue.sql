@@ -0,0 +1,257 @@
+-- Fila de jobs para distribuir o processamento de uploads entre nós
+-- Os nós de API só recebem o upload e enfileiram um job 'transcode'. Workers dedicados
+-- (backend/job_worker.py) reservam jobs com FOR UPDATE SKIP LOCKED, mantêm o lease com
+-- heartbeat e, ao concluir, enfileiram o próximo estágio ('transfer': Dropbox →
+-- Transkriptor → Supabase). Se um worker morre, o lease expira e outro nó retoma o job.
+-- Usa só recursos do Postgres (sem extensões do Supabase), então roda num Postgres local.
+
+CREATE TABLE IF NOT EXISTS jobs (
+  id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+  tipo TEXT NOT NULL CHECK (tipo IN ('transcode', 'transfer')),
+  status TEXT NOT NULL DEFAULT 'pendente' CHECK (status IN ('pendente', 'processando', 'concluido', 'erro')),
+  payload JSONB NOT NULL DEFAULT '{}',
+  resultado JSONB,
+  processo_id UUID,
+  parent_job_id UUID REFERENCES jobs(id) ON DELETE SET NULL,
+  tentativas INTEGER NOT NULL DEFAULT 0,
+  max_tentativas INTEGER NOT NULL DEFAULT 3,
+  worker_id TEXT,
+  lease_ate TIMESTAMPTZ,
+  proxima_tentativa_em TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  ultimo_erro TEXT,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Índices parciais: o claim só olha jobs em aberto
+CREATE INDEX IF NOT EXISTS idx_jobs_pendentes
+  ON jobs(tipo, proxima_tentativa_em)
+  WHERE status = 'pendente';
+CREATE INDEX IF NOT EXISTS idx_jobs_lease
+  ON jobs(tipo, lease_ate)
+  WHERE status = 'processando';
+CREATE INDEX IF NOT EXISTS idx_jobs_parent ON jobs(parent_job_id);
+
+-- updated_at automático (função própria para não depender das migrações do frontend)
+CREATE OR REPLACE FUNCTION jobs_set_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+  NEW.updated_at = NOW();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_jobs_updated_at ON jobs;
+CREATE TRIGGER trigger_jobs_updated_at BEFORE UPDATE ON jobs
+  FOR EACH ROW EXECUTE FUNCTION jobs_set_updated_at();
+
+-- Enfileira um job
+CREATE OR REPLACE FUNCTION enqueue_job(
+  tipo_param TEXT,
+  payload_param JSONB,
+  processo_id_param UUID DEFAULT NULL,
+  parent_job_id_param UUID DEFAULT NULL,
+  max_tentativas_param INTEGER DEFAULT 3
+)
+RETURNS UUID AS $$
+DECLARE
+  new_job_id UUID;
+BEGIN
+  INSERT INTO jobs (tipo, payload, processo_id, parent_job_id, max_tentativas)
+  VALUES (tipo_param, payload_param, processo_id_param, parent_job_id_param, max_tentativas_param)
+  RETURNING id INTO new_job_id;
+
+  RETURN new_job_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Reserva até batch_size jobs dos tipos pedidos para o worker.
+-- Jobs 'processando' com lease vencido (worker morreu) são retomados; se já
+-- esgotaram as tentativas, vão para 'erro' em vez de rodar de novo.
+CREATE OR REPLACE FUNCTION claim_jobs(
+  worker_id_param TEXT,
+  tipos_param TEXT[],
+  batch_size INTEGER DEFAULT 1,
+  lease_seconds INTEGER DEFAULT 60
+)
+RETURNS SETOF jobs AS $$
+BEGIN
+  UPDATE jobs
+  SET status = 'erro',
+      lease_ate = NULL,
+      ultimo_erro = COALESCE(ultimo_erro, 'Lease expirado após esgotar tentativas (worker ' || worker_id || ')')
+  WHERE status = 'processando'
+    AND tipo = ANY(tipos_param)
+    AND lease_ate < NOW()
+    AND tentativas >= max_tentativas;
+
+  RETURN QUERY
+  WITH lote AS (
+    SELECT j.id
+    FROM jobs j
+    WHERE j.tipo = ANY(tipos_param)
+      AND (
+        (j.status = 'pendente' AND j.proxima_tentativa_em <= NOW())
+        OR (j.status = 'processando' AND j.lease_ate < NOW())
+      )
+    ORDER BY j.proxima_tentativa_em, j.created_at
+    LIMIT batch_size
+    FOR UPDATE SKIP LOCKED
+  )
+  UPDATE jobs j
+  SET status = 'processando',
+      worker_id = worker_id_param,
+      tentativas = j.tentativas + 1,
+      lease_ate = NOW() + make_interval(secs => lease_seconds)
+  FROM lote
+  WHERE j.id = lote.id
+  RETURNING j.*;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Renova o lease. Retorna FALSE se o job não pertence mais ao worker (lease perdido).
+CREATE OR REPLACE FUNCTION heartbeat_job(
+  job_id_param UUID,
+  worker_id_param TEXT,
+  lease_seconds INTEGER DEFAULT 60
+)
+RETURNS BOOLEAN AS $$
+BEGIN
+  UPDATE jobs
+  SET lease_ate = NOW() + make_interval(secs => lease_seconds)
+  WHERE id = job_id_param
+    AND worker_id = worker_id_param
+    AND status = 'processando';
+
+  RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Checkpoint de um estágio com efeitos externos (ex.: pedido pago no Transkriptor).
+-- Mescla progresso_param em resultado; num retry o worker lê resultado e pula o que
+-- já foi feito. Retorna FALSE se o worker perdeu o job (deve parar antes do próximo efeito).
+CREATE OR REPLACE FUNCTION progress_job(
+  job_id_param UUID,
+  worker_id_param TEXT,
+  progresso_param JSONB
+)
+RETURNS BOOLEAN AS $$
+BEGIN
+  UPDATE jobs
+  SET resultado = COALESCE(resultado, '{}'::jsonb) || progresso_param
+  WHERE id = job_id_param
+    AND worker_id = worker_id_param
+    AND status = 'processando';
+
+  RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Conclui o job (só se o worker ainda for o dono); preserva os checkpoints de progress_job
+CREATE OR REPLACE FUNCTION complete_job(
+  job_id_param UUID,
+  worker_id_param TEXT,
+  resultado_param JSONB DEFAULT NULL
+)
+RETURNS BOOLEAN AS $$
+BEGIN
+  UPDATE jobs
+  SET status = 'concluido',
+      resultado = COALESCE(resultado, '{}'::jsonb) || COALESCE(resultado_param, '{}'::jsonb),
+      lease_ate = NULL,
+      ultimo_erro = NULL
+  WHERE id = job_id_param
+    AND worker_id = worker_id_param
+    AND status = 'processando';
+
+  RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Registra falha: volta para 'pendente' com backoff exponencial, ou 'erro' se
+-- esgotou as tentativas (ou se retry_param = FALSE, para erros definitivos)
+CREATE OR REPLACE FUNCTION fail_job(
+  job_id_param UUID,
+  worker_id_param TEXT,
+  erro_param TEXT,
+  retry_param BOOLEAN DEFAULT TRUE
+)
+RETURNS TEXT AS $$
+DECLARE
+  novo_status TEXT;
+BEGIN
+  UPDATE jobs
+  SET status = CASE
+        WHEN retry_param AND tentativas < max_tentativas THEN 'pendente'
+        ELSE 'erro'
+      END,
+      proxima_tentativa_em = NOW() + make_interval(secs => LEAST(600, 15 * power(2, tentativas - 1))),
+      lease_ate = NULL,
+      ultimo_erro = LEFT(erro_param, 2000)
+  WHERE id = job_id_param
+    AND worker_id = worker_id_param
+    AND status = 'processando'
+  RETURNING status INTO novo_status;
+
+  RETURN novo_status;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Estimativa da espera na fila por estágio, para somar ao ETA de um novo upload:
+-- jobs à frente (pendentes + metade dos em andamento), duração média recente
+-- (resultado.duracao_s gravado pelo worker) e workers ativos no estágio.
+CREATE OR REPLACE FUNCTION estimate_queue_wait(janela_horas INTEGER DEFAULT 24)
+RETURNS TABLE (tipo TEXT, na_fila NUMERIC, media_s DOUBLE PRECISION, workers BIGINT) AS $$
+BEGIN
+  RETURN QUERY
+  WITH fila AS (
+    SELECT j.tipo,
+           COUNT(*) FILTER (WHERE j.status = 'pendente')
+             + COUNT(*) FILTER (WHERE j.status = 'processando') / 2.0 AS na_fila
+    FROM jobs j
+    WHERE j.status IN ('pendente', 'processando')
+    GROUP BY j.tipo
+  ),
+  duracao AS (
+    SELECT j.tipo, AVG((j.resultado->>'duracao_s')::DOUBLE PRECISION) AS media_s
+    FROM jobs j
+    WHERE j.status = 'concluido'
+      AND j.resultado ? 'duracao_s'
+      AND j.updated_at > NOW() - make_interval(hours => janela_horas)
+    GROUP BY j.tipo
+  ),
+  ativos AS (
+    SELECT j.tipo, COUNT(DISTINCT j.worker_id) AS workers
+    FROM jobs j
+    WHERE j.worker_id IS NOT NULL
+      AND (j.status = 'processando' OR j.updated_at > NOW() - INTERVAL '15 minutes')
+    GROUP BY j.tipo
+  )
+  SELECT f.tipo, f.na_fila, d.media_s, COALESCE(a.workers, 0)
+  FROM fila f
+  LEFT JOIN duracao d ON d.tipo = f.tipo
+  LEFT JOIN ativos a ON a.tipo = f.tipo;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+COMMENT ON TABLE jobs IS 'Fila de jobs (transcode/transfer) distribuída entre workers via FOR UPDATE SKIP LOCKED';
+COMMENT ON FUNCTION claim_jobs(TEXT, TEXT[], INTEGER, INTEGER) IS 'Reserva jobs para um worker com lease; retoma jobs de workers mortos';
+COMMENT ON FUNCTION heartbeat_job(UUID, TEXT, INTEGER) IS 'Renova o lease; FALSE indica que o worker perdeu o job';
+COMMENT ON FUNCTION progress_job(UUID, TEXT, JSONB) IS 'Checkpoint em resultado para retomar um estágio sem repetir efeitos externos';
+COMMENT ON FUNCTION estimate_queue_wait(INTEGER) IS 'Backlog, duração média e workers ativos por estágio (espera na fila do ETA)';
+
+-- Instruções de uso:
+-- 1. Ativar o modo fila nos nós de API: JOB_QUEUE_ENABLED=true e DATABASE_URL no .env.
+--    O /upload passa a responder 202 com job_id; o andamento fica em GET /jobs/{job_id}.
+--
+-- 2. Subir workers (quantos forem necessários, em qualquer nó com acesso ao JOB_STAGING_DIR):
+--    python job_worker.py --tipos transcode
+--    python job_worker.py --tipos transfer
+--
+-- 3. Testar localmente:
+--    createdb honsha_jobs && psql honsha_jobs -f supabase/migrations/20250126000002_create_jobs_queue.sql
+--    DATABASE_URL=postgresql://localhost/honsha_jobs python job_queue.py
+--    (o self-test só roda com a tabela jobs vazia: ele reserva jobs de qualquer origem)
+--
+-- 4. Acompanhar a fila:
+--    SELECT tipo, status, COUNT(*) FROM jobs GROUP BY tipo, status;
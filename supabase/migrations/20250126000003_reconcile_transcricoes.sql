@@ -0,0 +1,82 @@
+-- Reconciliação de transcrições presas em 'Em Andamento'
+-- Se o callback do Transkriptor se perde, a linha fica 'Em Andamento' para sempre.
+-- O sweeper do backend (backend/reconcile.py) pagina só as linhas antigas nesse
+-- status, consulta o Transkriptor pelo order_id e aplica todas as mudanças de uma vez.
+
+-- Índice parcial: o custo da varredura acompanha o número de linhas presas,
+-- não o tamanho total da tabela
+CREATE INDEX IF NOT EXISTS idx_transcricoes_em_andamento
+  ON transcricoes(created_at, id)
+  WHERE status = 'Em Andamento';
+
+-- Página de transcrições paradas (keyset pagination por created_at, id)
+CREATE OR REPLACE FUNCTION list_stale_transcricoes(
+  cutoff_param TIMESTAMPTZ,
+  after_created_at TIMESTAMPTZ DEFAULT NULL,
+  after_id UUID DEFAULT NULL,
+  page_size INTEGER DEFAULT 200
+)
+RETURNS TABLE(
+  id UUID,
+  order_id TEXT,
+  created_at TIMESTAMPTZ
+) AS $$
+#variable_conflict use_column
+BEGIN
+  RETURN QUERY
+  SELECT t.id, t.order_id, t.created_at
+  FROM transcricoes t
+  WHERE t.status = 'Em Andamento'
+    AND t.created_at < cutoff_param
+    AND (
+      after_created_at IS NULL
+      OR (t.created_at, t.id) > (after_created_at, after_id)
+    )
+  ORDER BY t.created_at, t.id
+  LIMIT page_size;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Aplica em lote o resultado da reconciliação.
+-- updates_param: [{"id": "...", "status": "concluido"|"erro", "conteudo": "...", "erro": "...", "tempo_processamento": 123}, ...]
+-- Só altera linhas que ainda estão 'Em Andamento' (o callback pode ter chegado nesse meio tempo).
+CREATE OR REPLACE FUNCTION apply_transcricao_reconciliation(updates_param JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+  updated_count INTEGER;
+BEGIN
+  UPDATE transcricoes t
+  SET status = u.status,
+      conteudo = COALESCE(u.conteudo, t.conteudo),
+      erro = u.erro,
+      tempo_processamento = COALESCE(u.tempo_processamento, t.tempo_processamento)
+  FROM jsonb_to_recordset(updates_param) AS u(
+    id UUID,
+    status TEXT,
+    conteudo TEXT,
+    erro TEXT,
+    tempo_processamento INTEGER
+  )
+  WHERE t.id = u.id
+    AND t.status = 'Em Andamento'
+    AND u.status IN ('concluido', 'erro');
+
+  GET DIAGNOSTICS updated_count = ROW_COUNT;
+
+  INSERT INTO logs (level, message, metadata, created_at)
+  VALUES (
+    'info',
+    'Reconciliação de transcrições aplicada',
+    jsonb_build_object(
+      'recebidas', jsonb_array_length(updates_param),
+      'atualizadas', updated_count
+    ),
+    NOW()
+  );
+
+  RETURN updated_count;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION list_stale_transcricoes(TIMESTAMPTZ, TIMESTAMPTZ, UUID, INTEGER) IS 'Página de transcrições Em Andamento mais antigas que o corte (keyset pagination)';
+COMMENT ON FUNCTION apply_transcricao_reconciliation(JSONB) IS 'Aplica em um único UPDATE o resultado da reconciliação com o Transkriptor';
@@ -0,0 +1,19 @@
+-- Dados do pre-flight do upload (backend/preflight.py)
+-- duracao_audio_segundos: duração do áudio lida do container (ffprobe)
+-- previsao_conclusao:     ETA previsto para a transcrição ficar pronta no momento do upload
+-- tempo_preparo_segundos: tempo medido do pipeline de áudio até o link público no Dropbox
+--                         (sem espera na fila); alimenta o CostModel de todos os nós
+
+ALTER TABLE transcricoes
+ADD COLUMN IF NOT EXISTS duracao_audio_segundos NUMERIC(10, 2),
+ADD COLUMN IF NOT EXISTS previsao_conclusao TIMESTAMPTZ,
+ADD COLUMN IF NOT EXISTS tempo_preparo_segundos NUMERIC(10, 2);
+
+-- Leitura das observações recentes pelo CostModel
+CREATE INDEX IF NOT EXISTS idx_transcricoes_preparo_recentes
+  ON transcricoes(created_at DESC)
+  WHERE tempo_preparo_segundos IS NOT NULL;
+
+COMMENT ON COLUMN transcricoes.duracao_audio_segundos IS 'Duração do áudio enviado, em segundos (pre-flight)';
+COMMENT ON COLUMN transcricoes.previsao_conclusao IS 'Previsão de conclusão calculada no upload a partir da duração e do pipeline';
+COMMENT ON COLUMN transcricoes.tempo_preparo_segundos IS 'Segundos do início do pipeline de áudio até o link público no Dropbox (observação do CostModel)';